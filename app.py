@@ -1,19 +1,30 @@
-from flask import Flask, Request, request, render_template, redirect, url_for, flash, session
-import logging, datetime, json, dotenv, os
+from flask import Flask, Request, request, render_template, redirect, url_for, flash, session, g, get_flashed_messages
+import logging, datetime, json, dotenv, os, time
+from functools import lru_cache
 from user_agents import parse
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.utils import secure_filename
+from werkzeug.serving import make_server
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from log_segments import setup_logging
+from supervisor import create_listener
+import metrics
 import os
 
 dotenv.load_dotenv()
 
 UPLOAD_FOLDER = 'uploads'
+LOG_FILE = "hp-web.log"
+RENDER_CACHE_MAX_ENTRIES = 256
+USER_AGENT_CACHE_SIZE = 4096
 
 app = Flask(__name__, template_folder="templates")
 app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///sap.db"
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = True
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config["RENDER_CACHE"] = True
 
 if not os.environ.get("FLASK_SECRET_KEY"):
     if not os.path.exists(".env"):
@@ -31,7 +42,32 @@ login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
-logging.basicConfig(level=logging.INFO, format="%(message)s", filename="hp-web.log")
+WEB_REQUESTS = metrics.counter("web_requests_total", "HTTP requests handled by the web honeypot")
+WEB_REQUEST_SECONDS = metrics.histogram("web_request_seconds", "HTTP request latency per route")
+DB_QUERY_SECONDS = metrics.histogram("web_db_query_seconds", "SQL statement execution time")
+
+@app.before_request
+def start_request_timer():
+    if metrics.enabled:
+        g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    if metrics.enabled and "request_start" in g:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        WEB_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+        WEB_REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, route=route)
+    return response
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if metrics.enabled:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def record_query_metrics(conn, cursor, statement, parameters, context, executemany):
+    if metrics.enabled and conn.info.get("query_start"):
+        DB_QUERY_SECONDS.observe(time.perf_counter() - conn.info["query_start"].pop())
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -75,23 +111,62 @@ class Item(db.Model):
 def load_user(user_id):
     return db.session.get(User, int(user_id))
 
+@lru_cache(maxsize=USER_AGENT_CACHE_SIZE)
+def parse_user_agent(user_agent: str) -> str:
+    return str(parse(user_agent))
+
+def get_request_headers(request: Request):
+    # Routes log several events per request, capture and serialize the headers only once
+    if "request_headers" not in g:
+        g.request_headers = dict(request.headers)
+        g.request_headers_json = json.dumps(g.request_headers)
+        g.user_agent = parse_user_agent(request.headers.get("User-Agent") or "")
+    return g.request_headers, g.request_headers_json, g.user_agent
+
 def log_event(request: Request, **kwargs):
+    request_headers, request_headers_json, user_agent = get_request_headers(request)
     log_entry = {
         "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
         "client_ip": request.remote_addr,
         "event_type": kwargs.get("event_type", "generic_event"),
         "request_method": request.method,
         "request_path": request.path,
-        "request_headers": dict(request.headers),
-        "user_agent": str(parse(request.headers.get("User-Agent"))),
+    }
+    # Everything after the headers, which are spliced in already serialized
+    log_entry_tail = {
+        "user_agent": user_agent,
         "honeypot_type": "web",
     }
 
-    extra_fields = {k: v for k, v in kwargs.items() if k not in log_entry}
-    log_entry.update(extra_fields)
+    extra_fields = {k: v for k, v in kwargs.items() if k not in log_entry and k not in log_entry_tail and k != "request_headers"}
+    log_entry_tail.update(extra_fields)
+
+    print({**log_entry, "request_headers": request_headers, **log_entry_tail})
+    line = f'{json.dumps(log_entry)[:-1]}, "request_headers": {request_headers_json}, {json.dumps(log_entry_tail)[1:]}'
+    logging.info(line, extra={"event_type": log_entry["event_type"]})
+
+# (path, flashed messages) -> rendered page for anonymous GETs
+render_cache = {}
+
+def render_cached(template_name: str, **context) -> str:
+    """
+    render_template() for pages whose output only depends on the route and the
+    pending flash messages when nobody is logged in, e.g. crawlers hitting /login.
+    """
+    if not app.config["RENDER_CACHE"] or app.debug or request.method != "GET" or current_user.is_authenticated:
+        return render_template(template_name, **context)
+
+    key = (request.path, tuple(get_flashed_messages(with_categories=True)))
+    html = render_cache.get(key)
+    if html is None:
+        html = render_template(template_name, **context)
+        if len(render_cache) < RENDER_CACHE_MAX_ENTRIES:
+            render_cache[key] = html
+    return html
 
-    print(log_entry)
-    logging.info(json.dumps(log_entry))
+def precompile_templates():
+    for template_name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(template_name)
 
 @app.route("/", methods=["GET", "POST"])
 def index():
@@ -192,7 +267,7 @@ def import_passwords():
             log_event(request, event_type="file_upload_error", error=str(e))
             flash(f"An error occurred while uploading the file {filename}.", "error")
 
-    return render_template("import_passwords.html")
+    return render_cached("import_passwords.html")
 
 @app.route("/register", methods=["GET", "POST"])
 def register():
@@ -229,7 +304,7 @@ def register():
         flash("Registration successful! You can now log in.", "success")
         return redirect(url_for("login"))
 
-    return render_template("register.html")
+    return render_cached("register.html")
 
 @app.route("/login", methods=["GET", "POST"])
 def login():
@@ -255,7 +330,7 @@ def login():
             flash("Invalid email or password!", "error")
             return redirect(url_for("login"))
 
-    return render_template("login.html")
+    return render_cached("login.html")
 
 @app.route("/logout")
 @login_required
@@ -264,10 +339,18 @@ def logout():
     flash("You have been logged out.", "success")
     return redirect(url_for("login"))
 
-def run(host="0.0.0.0", port=8080):
+def run(host="0.0.0.0", port=8080, reuse_port=False, sock=None, log_file=LOG_FILE):
+    setup_logging(log_file)
     with app.app_context():
         db.create_all()
-    app.run(host=host, port=port)
+    precompile_templates()
+
+    if reuse_port or sock is not None:
+        if sock is None:
+            sock = create_listener(host, port, reuse_port=reuse_port)
+        make_server(host, port, app, threaded=True, fd=sock.fileno()).serve_forever()
+    else:
+        app.run(host=host, port=port)
 
 if __name__ == "__main__":
     try:
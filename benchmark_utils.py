@@ -0,0 +1,44 @@
+import os
+import time
+import socket
+import tempfile
+import contextlib
+import multiprocessing
+
+# Created on first use, one per benchmark run
+benchmark_log_folder = None
+
+def benchmark_log_file(filename: str) -> str:
+    """Where benchmarks log to, so synthetic traffic never ends up in (or rotates) the real hp-*.log files and concurrent runs don't share a log."""
+    global benchmark_log_folder
+    if benchmark_log_folder is None:
+        benchmark_log_folder = tempfile.mkdtemp(prefix="honeypot-benchmark-")
+    return os.path.join(benchmark_log_folder, filename)
+
+def wait_for_port(host: str, port: int, timeout: float = 10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Nothing listening on {host}:{port}")
+
+@contextlib.contextmanager
+def silenced_stdout():
+    """The honeypots print every event, which would otherwise dominate benchmark numbers."""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+def run_ssh_server(host: str, port: int, log_file: str):
+    from ssh_honeypot import start_server
+    with silenced_stdout():
+        start_server(host, port, log_file=log_file)
+
+def start_ssh_server(host: str, port: int, log_file: str) -> multiprocessing.Process:
+    """Forks the SSH honeypot so its GIL and printing stay out of the benchmark client's process."""
+    server = multiprocessing.get_context("fork").Process(target=run_ssh_server, args=(host, port, log_file), daemon=True)
+    server.start()
+    wait_for_port(host, port)
+    return server
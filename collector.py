@@ -0,0 +1,404 @@
+import os
+import glob
+import hmac
+import json
+import time
+import zlib
+import queue
+import select
+import socket
+import struct
+import logging
+import argparse
+import threading
+import socketserver
+from collections import deque
+from typing import List, Dict, Optional, Tuple
+from log_segments import SegmentedLogHandler, format_timestamp
+import metrics
+
+COLLECTOR_DEFAULT_HOST = "127.0.0.1"
+COLLECTOR_DEFAULT_PORT = 9500
+COLLECTED_FOLDER = "collected"
+SPOOL_FOLDER = "spool"
+
+# magic, sequence number, event count, compressed payload length
+FRAME = struct.Struct("!4sIII")
+FRAME_MAGIC = b"HPEV"
+ACK = struct.Struct("!I")
+HELLO_SEQ = 0
+
+MAX_BATCH_EVENTS = 500
+MAX_FRAME_BYTES = 16 * 1024 * 1024  # compressed, as announced in the frame header
+MAX_PAYLOAD_BYTES = 64 * 1024 * 1024  # after decompression
+MAX_FRAMES_IN_FLIGHT = 32  # frames sent before waiting for the oldest ACK
+FLUSH_INTERVAL = 1.0  # seconds a partial batch may wait
+MAX_QUEUED_EVENTS = 100_000
+MAX_SPOOL_BYTES = 1024 * 1024 * 1024
+RECONNECT_DELAY = 1
+MAX_RECONNECT_DELAY = 30
+SOCKET_TIMEOUT = 30
+STATS_INTERVAL = 10
+
+COLLECTOR_EVENTS = metrics.counter("collector_events_total", "Events ingested by the collector")
+COLLECTOR_FRAMES = metrics.counter("collector_frames_total", "Event frames ingested by the collector")
+COLLECTOR_BYTES = metrics.counter("collector_bytes_total", "Compressed frame bytes received by the collector")
+SENSOR_EVENTS_DROPPED = metrics.counter("sensor_events_dropped_total", "Events dropped because the shipping queue or spool was full")
+SENSOR_QUEUE_DEPTH = metrics.gauge("sensor_queue_depth", "Events waiting to be batched and shipped to the collector")
+SENSOR_FRAMES_SPOOLED = metrics.counter("sensor_frames_spooled_total", "Frames written to the local spool while the collector was unreachable")
+
+def encode_frame(seq: int, lines: List[bytes]) -> bytes:
+    payload = zlib.compress(b"".join(lines))
+    return FRAME.pack(FRAME_MAGIC, seq, len(lines), len(payload)) + payload
+
+def decompress_payload(data: bytes) -> bytes:
+    decompressor = zlib.decompressobj()
+    payload = decompressor.decompress(data, MAX_PAYLOAD_BYTES)
+    if decompressor.unconsumed_tail:
+        raise ValueError(f"frame decompresses to more than {MAX_PAYLOAD_BYTES} bytes")
+    return payload
+
+def recv_exactly(sock: socket.socket, size: int) -> Optional[bytes]:
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(size - len(buffer))
+        if not chunk:
+            return None
+        buffer += chunk
+    return bytes(buffer)
+
+def extract_field(line: str, key: str) -> Optional[str]:
+    """Reads a string field from a json.dumps() line without parsing the whole event."""
+    marker = f'"{key}": "'
+    start = line.find(marker)
+    if start == -1:
+        return None
+    start += len(marker)
+    end = line.find('"', start)
+    return line[start:end] if end != -1 else None
+
+class EventShipper(logging.Handler):
+    """
+    Batches formatted log records, compresses them into frames and pushes them
+    to a collector over one persistent TCP connection. Frames that can't be
+    delivered are spooled to disk and re-sent, oldest first, once the collector
+    is back. Logging calls never wait on the network.
+    """
+
+    def __init__(self, host: str, port: int, sensor_id: str, spool_folder: str = SPOOL_FOLDER, token: Optional[str] = None):
+        super().__init__()
+        self.address = (host, port)
+        self.sensor_id = sensor_id
+        self.token = token
+        self.spool_folder = spool_folder
+        self.records = queue.Queue(maxsize=MAX_QUEUED_EVENTS)
+        self.pending = deque()  # encoded frames not yet sent
+        self.in_flight = deque()  # (seq, frame, spool path) sent but not yet acknowledged
+        self.sock = None
+        self.seq = 0
+        self.reconnect_at = 0.0
+        self.reconnect_delay = RECONNECT_DELAY
+        self.stop_event = threading.Event()
+        self.events_sent = 0
+        os.makedirs(spool_folder, exist_ok=True)
+        # Scanned once; spool() and deliver() keep these up to date
+        spooled = self.spool_files()
+        self.spool_count = len(spooled)
+        self.spool_bytes = sum(os.path.getsize(f) for f in spooled)
+        self.pid = os.getpid()
+        metrics.register_collector(self.collect_metrics)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            self.records.put_nowait((self.format(record) + "\n").encode("utf-8"))
+        except queue.Full:
+            SENSOR_EVENTS_DROPPED.inc()
+        except Exception:
+            self.handleError(record)
+
+    def collect_metrics(self):
+        if os.getpid() == self.pid:  # not in workers forked after the shipper was created
+            SENSOR_QUEUE_DEPTH.set(self.records.qsize())
+
+    def next_seq(self) -> int:
+        self.seq = self.seq % 0xFFFFFFFF + 1
+        return self.seq
+
+    def next_batch(self) -> List[bytes]:
+        batch = []
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while len(batch) < MAX_BATCH_EVENTS:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.records.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def connect(self):
+        sock = socket.create_connection(self.address, timeout=SOCKET_TIMEOUT)
+        hello = encode_frame(HELLO_SEQ, [json.dumps({"sensor_id": self.sensor_id, "token": self.token}).encode("utf-8")])
+        sock.sendall(hello)
+        self.in_flight.append((HELLO_SEQ, hello, None))
+        self.sock = sock
+        self.receive_ack()
+        self.reconnect_delay = RECONNECT_DELAY
+
+    def send_frame(self, frame: bytes, spool_path: Optional[str] = None):
+        """Sends without waiting for the ACK, unless MAX_FRAMES_IN_FLIGHT are already unacknowledged."""
+        while len(self.in_flight) >= MAX_FRAMES_IN_FLIGHT:
+            self.receive_ack()
+        self.sock.sendall(frame)
+        self.in_flight.append((FRAME.unpack_from(frame)[1], frame, spool_path))
+
+    def receive_ack(self):
+        # The collector handles one connection's frames in order, so ACKs arrive in order too
+        ack = recv_exactly(self.sock, ACK.size)
+        seq, frame, spool_path = self.in_flight[0]
+        if ack is None or ACK.unpack(ack)[0] != seq:
+            raise ConnectionError("collector did not acknowledge frame")
+        self.in_flight.popleft()
+        if seq == HELLO_SEQ:
+            return
+        if spool_path:
+            os.remove(spool_path)
+            self.spool_count -= 1
+            self.spool_bytes -= len(frame)
+        self.events_sent += FRAME.unpack_from(frame)[2]
+
+    def disconnect(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+        # Unacknowledged frames from memory go to the spool; spooled ones are still on disk
+        for _, frame, spool_path in self.in_flight:
+            if spool_path is None and FRAME.unpack_from(frame)[1] != HELLO_SEQ:
+                self.spool(frame)
+        self.in_flight.clear()
+        while self.pending:
+            self.spool(self.pending.popleft())
+        self.reconnect_at = time.monotonic() + self.reconnect_delay
+        self.reconnect_delay = min(self.reconnect_delay * 2, MAX_RECONNECT_DELAY)
+
+    def spool_files(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.spool_folder, "*.frame")))
+
+    def spool(self, frame: bytes):
+        if self.spool_bytes + len(frame) > MAX_SPOOL_BYTES:
+            SENSOR_EVENTS_DROPPED.inc(FRAME.unpack_from(frame)[2])
+            print(f"ERROR spool {self.spool_folder} is full, dropping frame")
+            return
+        file_path = os.path.join(self.spool_folder, f"{time.time_ns():020d}.frame")
+        with open(file_path + ".tmp", "wb") as f:
+            f.write(frame)
+        os.replace(file_path + ".tmp", file_path)
+        self.spool_count += 1
+        self.spool_bytes += len(frame)
+        SENSOR_FRAMES_SPOOLED.inc()
+
+    def deliver(self, wait: bool = False):
+        """
+        Sends spooled frames (right after connecting), then in-memory ones.
+        ACKs that already arrived are collected; with `wait`, all of them are.
+        Raises OSError when the collector is unreachable.
+        """
+        if self.sock is None:
+            self.connect()
+            # Nothing is spooled while connected, so the spool only needs sending once per connection
+            for file_path in self.spool_files():
+                with open(file_path, "rb") as f:
+                    self.send_frame(f.read(), file_path)
+
+        while self.pending:
+            self.send_frame(self.pending.popleft())
+
+        while self.in_flight and (wait or select.select([self.sock], [], [], 0)[0]):
+            self.receive_ack()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            batch = self.next_batch()
+            if batch:
+                self.pending.append(encode_frame(self.next_seq(), batch))
+            if self.sock is None and time.monotonic() < self.reconnect_at:
+                while self.pending:
+                    self.spool(self.pending.popleft())
+                continue
+            if not self.pending and not self.in_flight and not (self.sock is None and self.spool_count):
+                continue
+            try:
+                self.deliver(wait=not batch)
+            except OSError:
+                self.disconnect()
+
+    def flush(self, timeout: float = 10):
+        deadline = time.monotonic() + timeout
+        while (not self.records.empty() or self.pending or self.in_flight) and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def close(self):
+        self.flush()
+        self.stop_event.set()
+        self.thread.join(FLUSH_INTERVAL * 2)
+        # Whatever didn't make it out survives the restart in the spool
+        while not self.records.empty():
+            self.pending.append(encode_frame(self.next_seq(), [self.records.get_nowait() for _ in range(min(MAX_BATCH_EVENTS, self.records.qsize()))]))
+        while self.pending:
+            self.spool(self.pending.popleft())
+        if self.sock:
+            self.sock.close()
+        super().close()
+
+class CollectorStore:
+    """Merges all sensor streams into one segmented log per honeypot type."""
+
+    def __init__(self, folder: str = COLLECTED_FOLDER):
+        os.makedirs(folder, exist_ok=True)
+        self.handlers = {
+            "ssh": SegmentedLogHandler(os.path.join(folder, "hp-ssh.log")),
+            "web": SegmentedLogHandler(os.path.join(folder, "hp-web.log")),
+        }
+
+    def write(self, sensor_id: str, payload: bytes):
+        entries = {"ssh": [], "web": []}
+        sensor_field = '{"sensor_id": ' + json.dumps(sensor_id) + ', '
+        now = format_timestamp(time.time())
+
+        for line in payload.decode("utf-8", errors="replace").splitlines():
+            if not line.startswith("{"):
+                continue  # paramiko/werkzeug text lines stay on the sensor
+            honeypot_type = "web" if '"honeypot_type": "web"' in line else "ssh"
+            timestamp = extract_field(line, "timestamp") or now
+            event_type = extract_field(line, "event_type") or "generic_event"
+            entries[honeypot_type].append(((sensor_field + line[1:] + "\n").encode("utf-8"), timestamp, event_type))
+
+        for honeypot_type, type_entries in entries.items():
+            if type_entries:
+                self.handlers[honeypot_type].write_many(type_entries)
+
+    def close(self):
+        for handler in self.handlers.values():
+            handler.close()
+
+class CollectorHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        sock = self.request
+        sensor_id = None
+        try:
+            while True:
+                header = recv_exactly(sock, FRAME.size)
+                if header is None:
+                    return
+                magic, seq, count, length = FRAME.unpack(header)
+                if magic != FRAME_MAGIC or length > MAX_FRAME_BYTES:
+                    print(f"ERROR collector: bad frame from {self.client_address[0]}")
+                    return
+                if sensor_id is None and seq != HELLO_SEQ:
+                    print(f"ERROR collector: {self.client_address[0]} sent events before its hello")
+                    return
+                compressed = recv_exactly(sock, length)
+                if compressed is None:
+                    return
+                payload = decompress_payload(compressed)
+
+                if seq == HELLO_SEQ:
+                    hello = json.loads(payload)
+                    if self.server.token and not hmac.compare_digest(str(hello.get("token") or ""), self.server.token):
+                        print(f"ERROR collector: {self.client_address[0]} sent a wrong token")
+                        return
+                    sensor_id = str(hello.get("sensor_id") or self.client_address[0])
+                    print(f"Sensor {sensor_id} connected from {self.client_address[0]}")
+                else:
+                    self.server.store.write(sensor_id, payload)
+                    self.server.record_ingest(count, len(compressed) + FRAME.size)
+                sock.sendall(ACK.pack(seq))
+        except (OSError, zlib.error, ValueError) as e:
+            print(f"ERROR collector {sensor_id or self.client_address[0]}: {e}")
+
+class CollectorServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str, port: int, store: CollectorStore, token: Optional[str] = None):
+        super().__init__((host, port), CollectorHandler)
+        self.store = store
+        self.token = token  # shared secret sensors must send in their hello, None accepts any sensor
+        self.lock = threading.Lock()
+        self.events = 0
+        self.frames = 0
+        self.bytes = 0
+        self.started_at = time.monotonic()
+
+    def record_ingest(self, events: int, size: int):
+        with self.lock:
+            self.events += events
+            self.frames += 1
+            self.bytes += size
+        COLLECTOR_EVENTS.inc(events)
+        COLLECTOR_FRAMES.inc()
+        COLLECTOR_BYTES.inc(size)
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            elapsed = time.monotonic() - self.started_at
+            return {
+                "events": self.events,
+                "frames": self.frames,
+                "bytes": self.bytes,
+                "events_per_sec": self.events / elapsed if elapsed else 0.0,
+            }
+
+def report_stats(server: CollectorServer, interval: float = STATS_INTERVAL):
+    last_events, last_time = 0, time.monotonic()
+    while True:
+        time.sleep(interval)
+        stats = server.stats()
+        now = time.monotonic()
+        rate = (stats["events"] - last_events) / (now - last_time)
+        last_events, last_time = stats["events"], now
+        print(f"Collector: {stats['events']} events, {stats['frames']} frames, {rate:.1f} events/sec")
+
+def start_collector(host=COLLECTOR_DEFAULT_HOST, port=COLLECTOR_DEFAULT_PORT, folder=COLLECTED_FOLDER, token=None) -> CollectorServer:
+    server = CollectorServer(host, port, CollectorStore(folder), token)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def parse_collector_address(address: str) -> Tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return (host or "127.0.0.1", int(port or COLLECTOR_DEFAULT_PORT))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Collect honeypot events pushed by sensors")
+
+    parser.add_argument("-a", "--host", type=str, default=COLLECTOR_DEFAULT_HOST)
+    parser.add_argument("-p", "--port", type=int, default=COLLECTOR_DEFAULT_PORT)
+    parser.add_argument("-o", "--output", type=str, default=COLLECTED_FOLDER)
+    parser.add_argument("-m", "--metrics-port", type=int, default=None)
+    parser.add_argument("--token", type=str, default=os.environ.get("COLLECTOR_TOKEN"), help="Shared secret sensors must present (default: $COLLECTOR_TOKEN)")
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.metrics_port:
+        metrics.start_metrics_server(port=args.metrics_port)
+
+    if args.host not in ("127.0.0.1", "localhost", "::1") and not args.token:
+        print(f"WARNING collector on {args.host} accepts events from anyone who can reach it, set --token")
+    server = CollectorServer(args.host, args.port, CollectorStore(args.output), args.token)
+    threading.Thread(target=report_stats, args=(server,), daemon=True).start()
+    print(f"Collector listening on {args.host}:{args.port}, writing to {args.output}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.store.close()
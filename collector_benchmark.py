@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import multiprocessing
+from collector import EventShipper, start_collector
+from log_segments import format_timestamp
+from benchmark_utils import silenced_stdout
+
+EVENT_TYPES = ["login_attempt", "login_fail", "command_input", "GET /login", "POST /login"]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Push synthetic events from several sensor processes to a local collector and report ingest events/sec")
+
+    parser.add_argument("-p", "--port", type=int, default=9599)
+    parser.add_argument("-s", "--sensors", type=int, default=4)
+    parser.add_argument("-n", "--events", type=int, default=50_000, help="Events per sensor")
+    parser.add_argument("--collector-delay", type=float, default=0, help="Seconds to keep the collector down so sensors have to spool")
+    parser.add_argument("-o", "--output", type=str, default=None, help="Collector store folder, a temporary one by default")
+
+    return parser.parse_args()
+
+def synthetic_event(sensor: int, i: int) -> str:
+    honeypot_type = "web" if i % 4 == 0 else "ssh"
+    return json.dumps({
+        "timestamp": format_timestamp(time.time()),
+        "honeypot_type": honeypot_type,
+        "event_type": EVENT_TYPES[i % len(EVENT_TYPES)],
+        "client_ip": f"10.{sensor}.{i // 256 % 256}.{i % 256}",
+        "client_port": 40000 + i % 20000,
+        "username": "root",
+        "password": f"password{i % 1000}",
+    })
+
+def run_sensor(sensor: int, port: int, events: int, spool_folder: str):
+    logger = logging.getLogger(f"sensor-{sensor}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    shipper = EventShipper("127.0.0.1", port, f"sensor-{sensor}", spool_folder)
+    logger.addHandler(shipper)
+
+    for i in range(events):
+        logger.info(synthetic_event(sensor, i))
+        if i % 1000 == 0:
+            time.sleep(0)  # let the shipping thread batch
+
+    # Drain through the spool as well; close() only spools what's left after the timeout
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline and (not shipper.records.empty() or shipper.pending or shipper.in_flight or shipper.spool_count):
+        time.sleep(0.05)
+    shipper.close()
+
+def count_lines(folder: str) -> int:
+    total = 0
+    for name in os.listdir(folder):
+        if ".log" in name and not name.endswith(".idx.json"):
+            with open(os.path.join(folder, name), "rb") as f:
+                total += sum(1 for _ in f)
+    return total
+
+if __name__ == "__main__":
+    args = parse_args()
+    folder = args.output or tempfile.mkdtemp(prefix="collector-benchmark-")
+    context = multiprocessing.get_context("fork")
+    expected = args.sensors * args.events
+
+    sensors = [
+        context.Process(target=run_sensor, args=(i, args.port, args.events, os.path.join(folder, f"spool-{i}")))
+        for i in range(args.sensors)
+    ]
+    start = time.perf_counter()
+    for sensor in sensors:
+        sensor.start()
+
+    if args.collector_delay:
+        time.sleep(args.collector_delay)
+    # Silence the collector's connection messages
+    with silenced_stdout():
+        server = start_collector("127.0.0.1", args.port, os.path.join(folder, "collected"))
+        ingest_start = time.perf_counter()
+        for sensor in sensors:
+            sensor.join()
+        elapsed = time.perf_counter() - start
+        ingest_elapsed = time.perf_counter() - ingest_start
+        server.shutdown()
+        server.store.close()
+
+    stats = server.stats()
+    stored = count_lines(os.path.join(folder, "collected"))
+    print(f"sensors                  {args.sensors}")
+    print(f"events_sent              {expected}")
+    print(f"events_ingested          {stats['events']}")
+    print(f"events_stored            {stored}")
+    print(f"frames                   {stats['frames']}")
+    print(f"bytes_per_event          {stats['bytes'] / max(stats['events'], 1):.2f}")
+    print(f"elapsed_sec              {elapsed:.2f}")
+    print(f"ingest_events_per_sec    {stats['events'] / ingest_elapsed:.1f}")
+
+    if not args.output:
+        shutil.rmtree(folder)
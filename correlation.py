@@ -0,0 +1,346 @@
+import os
+import csv
+import json
+import heapq
+import sqlite3
+import tempfile
+import hashlib
+import argparse
+import datetime
+import itertools
+from typing import Dict, List, Any, Iterator, Iterable, Optional, Tuple
+from log_segments import iter_log_lines, to_timestamp_str
+
+SESSION_GAP = 30 * 60  # seconds of silence from an IP that ends its session
+REORDER_WINDOW = 5  # seconds of out-of-order tolerance within one log
+EXPIRE_EVERY = 10_000  # events between sweeps for idle sessions
+MAX_VALUES = 50  # usernames/passwords/commands/paths kept per session
+MAX_PENDING_CAMPAIGNS = 50_000  # campaigns held in memory before they're merged into the on-disk store
+SOURCE_SSH = "ssh"
+SOURCE_WEB = "web"
+SOURCE_COWRIE = "cowrie"
+SOURCE_BITS = {SOURCE_SSH: 1, SOURCE_WEB: 2, SOURCE_COWRIE: 4}
+
+# (epoch seconds, tie breaker, client ip, source, log entry)
+Event = Tuple[float, int, str, str, Dict[str, Any]]
+
+def parse_timestamp(value: str) -> Optional[float]:
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+def iter_events(file_path: str, default_source: str, start=None, end=None, counter=None) -> Iterator[Event]:
+    """Yields the JSON events of one log (and its rotated segments) that carry a client IP and timestamp."""
+    counter = counter or itertools.count()
+    start_ts = parse_timestamp(to_timestamp_str(start)) if start else None
+    end_ts = parse_timestamp(to_timestamp_str(end)) if end else None
+
+    for line in iter_log_lines(file_path, start, end):
+        if not line.startswith("{"):
+            continue  # werkzeug/paramiko text lines
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+
+        ip = entry.get("client_ip") or entry.get("src_ip")
+        ts = parse_timestamp(entry.get("timestamp"))
+        if not ip or ts is None:
+            continue
+        if (start_ts and ts < start_ts) or (end_ts and ts > end_ts):
+            continue
+
+        source = SOURCE_COWRIE if "eventid" in entry else entry.get("honeypot_type", default_source)
+        yield ts, next(counter), ip, source, entry
+
+def reorder(events: Iterable[Event], window: float = REORDER_WINDOW, stats: Optional[Dict[str, int]] = None) -> Iterator[Event]:
+    """
+    Sorts a nearly time-ordered stream using a heap that only spans `window`
+    seconds. Events older than what was already emitted can't be put back in
+    order; they are passed through and counted in stats["late_events"].
+    """
+    heap = []
+    watermark = float("-inf")
+    for event in events:
+        if event[0] < watermark and stats is not None:
+            stats["late_events"] = stats.get("late_events", 0) + 1
+        heapq.heappush(heap, event)
+        while heap[0][0] < event[0] - window:
+            watermark = heap[0][0]
+            yield heapq.heappop(heap)
+    while heap:
+        yield heapq.heappop(heap)
+
+def merge_events(sources: Dict[str, str], start=None, end=None, window: float = REORDER_WINDOW, stats: Optional[Dict[str, int]] = None) -> Iterator[Event]:
+    """k-way merge of all logs into one time-ordered stream; memory is bounded by the reorder window."""
+    counter = itertools.count()
+    streams = []
+    for file_path, source in {path: source for source, path in sources.items()}.items():
+        streams.append(reorder(iter_events(file_path, source, start, end, counter), window, stats))
+    return heapq.merge(*streams)
+
+def add_bounded(values: List[Any], value: Any):
+    if value is not None and len(values) < MAX_VALUES:
+        values.append(value)
+
+class Session:
+    def __init__(self, ip: str, ts: float):
+        self.ip = ip
+        self.start = ts
+        self.end = ts
+        self.events = 0
+        self.sources: Dict[str, int] = {}
+        self.credentials: List[Tuple[str, str]] = []
+        self.commands: List[str] = []
+        self.paths: List[str] = []
+
+    def add(self, ts: float, source: str, entry: Dict[str, Any]):
+        self.end = max(self.end, ts)
+        self.events += 1
+        self.sources[source] = self.sources.get(source, 0) + 1
+
+        if "password" in entry and "username" in entry:
+            add_bounded(self.credentials, (str(entry["username"]), str(entry["password"])))
+        command = entry.get("command") if source != SOURCE_COWRIE else entry.get("input")
+        add_bounded(self.commands, command)
+        if source == SOURCE_WEB:
+            add_bounded(self.paths, entry.get("request_path"))
+
+    def fingerprint(self) -> Optional[str]:
+        """Identifies what the session did independent of who did it, so sessions from different IPs running the same playbook land in one campaign."""
+        if not (self.credentials or self.commands or self.paths):
+            return None
+        key = json.dumps([sorted(set(self.credentials)), self.commands, sorted(set(self.paths))])
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+
+    def to_row(self) -> Dict[str, Any]:
+        return {
+            "client_ip": self.ip,
+            "start": datetime.datetime.fromtimestamp(self.start).strftime("%Y-%m-%d %H:%M:%S"),
+            "end": datetime.datetime.fromtimestamp(self.end).strftime("%Y-%m-%d %H:%M:%S"),
+            "duration_sec": round(self.end - self.start, 3),
+            "events": self.events,
+            "sources": "+".join(sorted(self.sources)),
+            "ssh_events": self.sources.get(SOURCE_SSH, 0),
+            "web_events": self.sources.get(SOURCE_WEB, 0),
+            "cowrie_events": self.sources.get(SOURCE_COWRIE, 0),
+            "credentials": len(set(self.credentials)),
+            "commands": json.dumps(self.commands),
+            "paths": json.dumps(sorted(set(self.paths))),
+            "fingerprint": self.fingerprint(),
+        }
+
+class Campaign:
+    """Sessions of one fingerprint since the last merge into the CampaignStore."""
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.sessions = 0
+        self.ips = set()
+        self.sources = 0
+        self.first_seen = None
+        self.last_seen = None
+        self.example = None
+
+    def add(self, session: Session):
+        self.sessions += 1
+        self.ips.add(session.ip)
+        for source in session.sources:
+            self.sources |= SOURCE_BITS[source]
+        self.first_seen = session.start if self.first_seen is None else min(self.first_seen, session.start)
+        self.last_seen = session.end if self.last_seen is None else max(self.last_seen, session.end)
+        if self.example is None:
+            self.example = session.to_row()
+
+class CampaignStore:
+    """
+    Campaign aggregates and their distinct IPs, kept in a temporary SQLite file
+    so memory doesn't grow with the number of distinct fingerprints.
+    """
+
+    def __init__(self):
+        fd, self.path = tempfile.mkstemp(prefix="campaigns-", suffix=".db")
+        os.close(fd)
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript("""
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE campaigns (
+                fingerprint TEXT PRIMARY KEY, sessions INTEGER, sources INTEGER,
+                first_seen REAL, last_seen REAL, commands TEXT, paths TEXT, example_ip TEXT
+            );
+            CREATE TABLE campaign_ips (fingerprint TEXT, ip TEXT, PRIMARY KEY (fingerprint, ip)) WITHOUT ROWID;
+        """)
+
+    def merge(self, campaigns: Iterable[Campaign]):
+        campaigns = list(campaigns)
+        self.db.executemany("""
+            INSERT INTO campaigns VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (fingerprint) DO UPDATE SET
+                sessions = sessions + excluded.sessions,
+                sources = sources | excluded.sources,
+                first_seen = min(first_seen, excluded.first_seen),
+                last_seen = max(last_seen, excluded.last_seen)
+        """, [
+            (c.fingerprint, c.sessions, c.sources, c.first_seen, c.last_seen, c.example["commands"], c.example["paths"], c.example["client_ip"])
+            for c in campaigns
+        ])
+        self.db.executemany("INSERT OR IGNORE INTO campaign_ips VALUES (?, ?)", ((c.fingerprint, ip) for c in campaigns for ip in c.ips))
+        self.db.commit()
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        """All campaigns, most IPs first."""
+        cursor = self.db.execute("""
+            SELECT c.*, ips.unique_ips FROM campaigns c
+            JOIN (SELECT fingerprint, COUNT(*) AS unique_ips FROM campaign_ips GROUP BY fingerprint) ips USING (fingerprint)
+            ORDER BY ips.unique_ips DESC, c.sessions DESC
+        """)
+        for fingerprint, sessions, sources, first_seen, last_seen, commands, paths, example_ip, unique_ips in cursor:
+            yield {
+                "fingerprint": fingerprint,
+                "sessions": sessions,
+                "unique_ips": unique_ips,
+                "sources": "+".join(sorted(source for source, bit in SOURCE_BITS.items() if sources & bit)),
+                "first_seen": datetime.datetime.fromtimestamp(first_seen).strftime("%Y-%m-%d %H:%M:%S"),
+                "last_seen": datetime.datetime.fromtimestamp(last_seen).strftime("%Y-%m-%d %H:%M:%S"),
+                "commands": commands,
+                "paths": paths,
+                "example_ip": example_ip,
+            }
+
+    def close(self):
+        self.db.close()
+        os.remove(self.path)
+
+class Correlator:
+    """
+    Sweeps a time-ordered event stream once. Only sessions of IPs seen within
+    the last `gap` seconds stay in memory; older ones are closed and handed to
+    the session writer and campaign store. Campaigns are batched in memory and
+    merged into the on-disk store every `max_pending` fingerprints.
+    """
+
+    def __init__(self, gap: float = SESSION_GAP, max_pending: int = MAX_PENDING_CAMPAIGNS):
+        self.gap = gap
+        self.max_pending = max_pending
+        self.open_sessions: Dict[str, Session] = {}
+        self.campaigns: Dict[str, Campaign] = {}
+        self.store = CampaignStore()
+        self.events = 0
+        self.sessions = 0
+
+    def feed(self, event: Event) -> Iterator[Session]:
+        ts, _, ip, source, entry = event
+        self.events += 1
+
+        session = self.open_sessions.get(ip)
+        if session and ts - session.end > self.gap:
+            yield self.close(self.open_sessions.pop(ip))
+            session = None
+        if session is None:
+            session = self.open_sessions[ip] = Session(ip, ts)
+        session.add(ts, source, entry)
+
+        if self.events % EXPIRE_EVERY == 0:
+            yield from self.expire(ts)
+
+    def expire(self, now: float) -> Iterator[Session]:
+        for ip in [ip for ip, session in self.open_sessions.items() if now - session.end > self.gap]:
+            yield self.close(self.open_sessions.pop(ip))
+
+    def flush(self) -> Iterator[Session]:
+        for ip in list(self.open_sessions):
+            yield self.close(self.open_sessions.pop(ip))
+        self.flush_campaigns()
+
+    def flush_campaigns(self):
+        self.store.merge(self.campaigns.values())
+        self.campaigns.clear()
+
+    def close(self, session: Session) -> Session:
+        self.sessions += 1
+        fingerprint = session.fingerprint()
+        if fingerprint:
+            campaign = self.campaigns.get(fingerprint)
+            if campaign is None:
+                if len(self.campaigns) >= self.max_pending:
+                    self.flush_campaigns()
+                campaign = self.campaigns[fingerprint] = Campaign(fingerprint)
+            campaign.add(session)
+        return session
+
+SESSION_FIELDS = ["client_ip", "start", "end", "duration_sec", "events", "sources", "ssh_events", "web_events", "cowrie_events", "credentials", "commands", "paths", "fingerprint"]
+CAMPAIGN_FIELDS = ["fingerprint", "sessions", "unique_ips", "sources", "first_seen", "last_seen", "commands", "paths", "example_ip"]
+
+def correlate(sources: Dict[str, str], gap: float = SESSION_GAP, start=None, end=None, file_prefix: str = "", reorder_window: float = REORDER_WINDOW) -> Dict[str, Any]:
+    """
+    Correlates `sources` ({"ssh": path, "web": path, "cowrie": path}) by client
+    IP and time. Sessions are streamed to {file_prefix}sessions.csv as they
+    close, campaigns (sessions with the same fingerprint) go to
+    {file_prefix}campaigns.csv.
+    """
+    correlator = Correlator(gap)
+    multi_source_sessions = campaigns = multi_ip_campaigns = 0
+    reorder_stats = {"late_events": 0}
+    sessions_filename = f"{file_prefix}sessions.csv"
+    campaigns_filename = f"{file_prefix}campaigns.csv"
+
+    try:
+        with open(sessions_filename, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=SESSION_FIELDS)
+            writer.writeheader()
+
+            def write(sessions: Iterable[Session]):
+                nonlocal multi_source_sessions
+                for session in sessions:
+                    writer.writerow(session.to_row())
+                    if len(session.sources) > 1:
+                        multi_source_sessions += 1
+
+            for event in merge_events(sources, start, end, reorder_window, reorder_stats):
+                write(correlator.feed(event))
+            write(correlator.flush())
+        print(f"Created {sessions_filename}")
+        if reorder_stats["late_events"]:
+            print(f"WARNING correlate(): {reorder_stats['late_events']} events arrived more than {reorder_window}s out of order, try a larger --reorder-window")
+
+        with open(campaigns_filename, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=CAMPAIGN_FIELDS)
+            writer.writeheader()
+            for row in correlator.store.rows():
+                writer.writerow(row)
+                campaigns += 1
+                if row["unique_ips"] > 1:
+                    multi_ip_campaigns += 1
+        print(f"Created {campaigns_filename}")
+    finally:
+        correlator.store.close()
+
+    return {
+        "events": correlator.events,
+        "sessions": correlator.sessions,
+        "multi_source_sessions": multi_source_sessions,
+        "campaigns": campaigns,
+        "multi_ip_campaigns": multi_ip_campaigns,
+        "late_events": reorder_stats["late_events"],
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Correlate SSH, web and Cowrie honeypot logs into sessions and campaigns")
+
+    parser.add_argument("--ssh", type=str, default=None)
+    parser.add_argument("--web", type=str, default=None)
+    parser.add_argument("--cowrie", type=str, default=None)
+    parser.add_argument("--gap", type=float, default=SESSION_GAP)
+    parser.add_argument("--start", type=str, default=None)
+    parser.add_argument("--end", type=str, default=None)
+    parser.add_argument("--prefix", type=str, default="")
+    parser.add_argument("--reorder-window", type=float, default=REORDER_WINDOW, help="Seconds of out-of-order tolerance within one log")
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    sources = {source: path for source, path in ((SOURCE_SSH, args.ssh), (SOURCE_WEB, args.web), (SOURCE_COWRIE, args.cowrie)) if path}
+    print(correlate(sources, args.gap, args.start, args.end, args.prefix, args.reorder_window))
@@ -0,0 +1,138 @@
+import time
+import hashlib
+import threading
+from array import array
+from typing import Dict, Tuple, Callable, Optional
+
+SUMMARY_INTERVAL = 60  # seconds between repeat-count summaries
+SUMMARY_CHUNK_SIZE = 1000  # credential ids per summary event
+INDEX_SLOTS = 1 << 20  # 16 bytes per slot, so 16 MiB per process
+MAX_PROBE = 8  # slots searched before the least recently seen one is evicted
+MAX_COUNT = 0xFFFFFFFF
+
+def credential_id(client_ip: str, username: str, password: str) -> str:
+    key = f"{client_ip}\0{username}\0{password}".encode("utf-8", errors="surrogateescape")
+    return hashlib.blake2b(key, digest_size=8).hexdigest()
+
+class CredentialIndex:
+    """
+    Fixed-size open-addressing table of 64-bit credential hashes to attempt
+    counts. Memory never grows; when a probe window is full, the entry seen
+    least recently is evicted, so only stale tuples get reported as new again.
+    """
+
+    def __init__(self, slots: int = INDEX_SLOTS):
+        slots = 1 << max(slots - 1, 1).bit_length()  # round up to a power of two
+        self.mask = slots - 1
+        self.keys = array("Q", [0]) * slots  # 0 marks an empty slot
+        self.counts = array("I", [0]) * slots
+        self.last_seen = array("I", [0]) * slots  # seconds since start
+        self.started_at = time.monotonic()
+        self.size = 0
+        self.evictions = 0
+
+    def find(self, key: int) -> Tuple[int, bool]:
+        """Returns the slot holding `key`, or the slot to store it in and False."""
+        key = key or 1
+        slot = key & self.mask
+        victim = slot
+        for i in range(MAX_PROBE):
+            probe = (slot + i) & self.mask
+            stored = self.keys[probe]
+            if stored == key:
+                return probe, True
+            if stored == 0:
+                return probe, False
+            if self.last_seen[probe] < self.last_seen[victim]:
+                victim = probe
+        return victim, False
+
+    def increment(self, key: int) -> int:
+        """Counts one attempt of `key` and returns its total (1 when new or evicted before)."""
+        slot, found = self.find(key)
+        now = int(time.monotonic() - self.started_at)
+        self.last_seen[slot] = now
+        if found:
+            count = min(self.counts[slot] + 1, MAX_COUNT)
+            self.counts[slot] = count
+            return count
+        if self.keys[slot]:
+            self.evictions += 1
+        else:
+            self.size += 1
+        self.keys[slot] = key or 1
+        self.counts[slot] = 1
+        return 1
+
+    def get(self, key: int) -> int:
+        slot, found = self.find(key)
+        return self.counts[slot] if found else 0
+
+class CredentialAggregator:
+    """
+    Deduplicates failed (client_ip, username, password) attempts. The first
+    attempt of each tuple is reported right away; repeats are only counted and
+    emitted as {credential_id: count} summaries every `interval` seconds.
+    """
+
+    def __init__(self, emit_summary: Callable[[Dict[str, int], float, float], None], interval: float = SUMMARY_INTERVAL, index_slots: int = INDEX_SLOTS):
+        self.emit_summary = emit_summary
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.totals = CredentialIndex(index_slots)  # 64-bit credential hash -> attempts since first seen
+        self.repeats: Dict[int, int] = {}  # attempts not yet reported
+        self.window_start = time.time()
+        self.attempts = 0
+        self.thread: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+
+    def add(self, client_ip: str, username: str, password: str) -> Tuple[str, bool]:
+        """Counts one attempt and returns its credential id and whether it was seen for the first time."""
+        cid = credential_id(client_ip, username, password)
+        key = int(cid, 16)
+        with self.lock:
+            self.attempts += 1
+            if self.totals.increment(key) == 1:
+                return cid, True
+            self.repeats[key] = self.repeats.get(key, 0) + 1
+        return cid, False
+
+    def total(self, client_ip: str, username: str, password: str) -> int:
+        with self.lock:
+            return self.totals.get(int(credential_id(client_ip, username, password), 16))
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "credentials_unique": self.totals.size,
+                "credentials_evicted": self.totals.evictions,
+                "credentials_pending": len(self.repeats),
+                "attempts": self.attempts,
+            }
+
+    def flush(self):
+        with self.lock:
+            repeats, self.repeats = self.repeats, {}
+            window_start, self.window_start = self.window_start, time.time()
+        window_end = self.window_start
+
+        items = [(f"{key:016x}", count) for key, count in repeats.items()]
+        for i in range(0, len(items), SUMMARY_CHUNK_SIZE):
+            self.emit_summary(dict(items[i:i + SUMMARY_CHUNK_SIZE]), window_start, window_end)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"ERROR flush(): {e}")
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.flush()
@@ -5,6 +5,8 @@ import os
 import pandas as pd
 import matplotlib.pyplot as plt
 from typing import List, Dict, Set, Any
+from log_segments import iter_log_lines, to_timestamp_str
+from correlation import correlate
 
 CACHE_FILENAME = "ip_info_cache.json"
 FLASK_LOG_PATTERN = re.compile(r'(?P<client_ip>(\d{1,3}\.){3}\d{1,3}) - - \[(?P<timestamp>.*?)\] (?P<message>.*)')
@@ -39,23 +41,31 @@ def parse_flask_log(line: str) -> Dict[str, Any]:
     else:
         return {}
 
-def json_to_list(file_path: str) -> List[Dict[str, Any]]:
+def json_to_list(file_path: str, start=None, end=None) -> List[Dict[str, Any]]:
+    """
+    Reads `file_path` plus any rotated (possibly compressed) segments of it.
+    When `start`/`end` are given, segments outside the window are skipped and
+    JSON entries are filtered on their timestamp.
+    """
+    start, end = to_timestamp_str(start), to_timestamp_str(end)
     log_entries = []
     try:
-        with open(file_path, 'r') as log_file:
-            for line in log_file:
-                line = line.strip()
-                if not line:
-                    continue
-
-                if is_json_log(line):
-                    log_entry = parse_json_log(line)
-                    log_entries.append(log_entry)
-                elif is_flask_log(line):
-                    log_entry = parse_flask_log(line)
-                    log_entries.append(log_entry)
-                else:
+        for line in iter_log_lines(file_path, start, end):
+            line = line.strip()
+            if not line:
+                continue
+
+            if is_json_log(line):
+                log_entry = parse_json_log(line)
+                timestamp = log_entry.get("timestamp") if isinstance(log_entry, dict) else None
+                if timestamp and ((start and timestamp < start) or (end and timestamp > end)):
                     continue
+                log_entries.append(log_entry)
+            elif is_flask_log(line):
+                log_entry = parse_flask_log(line)
+                log_entries.append(log_entry)
+            else:
+                continue
 
     except Exception as e:
         print(f"ERROR reading file {file_path}: {e}")
@@ -164,6 +174,41 @@ def filter_by_key_value(df: pd.DataFrame, filter_key, filter_value, export: bool
         print(f"Created {filename}")
     return filtered_df
 
+def get_credential_counts(logs: List[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    Rebuilds per-(client_ip, username, password) attempt counts from the SSH
+    honeypot's deduplicated `login_fail` events and `login_fail_summary` repeats.
+    """
+    credentials = {}
+    counts = {}
+
+    for entry in logs:
+        event_type = entry.get("event_type")
+        if event_type == "login_fail":
+            cid = entry.get("credential_id") or f"{entry.get('client_ip')}\0{entry.get('username')}\0{entry.get('password')}"
+            credentials.setdefault(cid, (entry.get("client_ip"), entry.get("username"), entry.get("password")))
+            counts[cid] = counts.get(cid, 0) + 1
+        elif event_type == "login_fail_summary":
+            for cid, count in entry.get("counts", {}).items():
+                counts[cid] = counts.get(cid, 0) + count
+
+    rows = [(*credentials[cid], count) for cid, count in counts.items() if cid in credentials]
+    return pd.DataFrame(rows, columns=["client_ip", "username", "password", "count"])
+
+def get_credential_frequency_counts(df_credentials: pd.DataFrame, keys: List[str], export: bool = True, file_prefix="") -> Dict[str, pd.DataFrame]:
+    results = {}
+
+    for key in keys:
+        freq_counts_df = df_credentials.groupby(key)["count"].sum().sort_values(ascending=False).reset_index()
+        results[key] = freq_counts_df
+
+        if export:
+            filename = f"{file_prefix}freq_{key}.csv"
+            freq_counts_df.to_csv(filename)
+            print(f"Created {filename}")
+
+    return results
+
 def get_unique_ip_info_df(logs: List[Dict[str, Any]], ip_key: str, cache_filename: str = CACHE_FILENAME) -> pd.DataFrame:
     unique_ips = get_unique_values(ip_key, logs)
     unique_ips_info = get_ip_info(list(unique_ips), cache_filename)
@@ -238,7 +283,11 @@ logs_ssh_hp = [
 ]
 
 df_ssh_hp = pd.DataFrame(logs_ssh_hp)
-freq_counts = get_frequency_counts(df_ssh_hp, ["client_ip", "username", "password"], file_prefix=FILE_PREFIX_SSH_HP)
+freq_counts = get_frequency_counts(df_ssh_hp, ["client_ip"], file_prefix=FILE_PREFIX_SSH_HP)
+plot_frequency_counts(freq_counts, top_n=20, file_prefix=FILE_PREFIX_SSH_HP)
+
+df_ssh_hp_credentials = get_credential_counts(logs_ssh_hp)
+freq_counts = get_credential_frequency_counts(df_ssh_hp_credentials, ["username", "password"], file_prefix=FILE_PREFIX_SSH_HP)
 plot_frequency_counts(freq_counts, top_n=20, file_prefix=FILE_PREFIX_SSH_HP)
 
 df_ssh_hp_ip_info = get_unique_ip_info_df(logs_ssh_hp, ip_key="client_ip")
@@ -249,8 +298,9 @@ plot_frequency_counts(freq_counts_ip_info, top_n=20, file_prefix=FILE_PREFIX_SSH
 unique_ips_hp = get_unique_values("client_ip", logs_ssh_hp)
 print(f"Number of distinct IPs: {len(unique_ips_hp)}")
 
-unique_username_password = df_ssh_hp.groupby(["username", "password"]).ngroups
+unique_username_password = df_ssh_hp_credentials.groupby(["username", "password"]).ngroups
 print(f"Number of unique username-password combinations: {unique_username_password}")
+print(f"Number of failed login attempts: {df_ssh_hp_credentials['count'].sum()}")
 
 print("============================== Web Honeypot ==============================")
 
@@ -276,7 +326,14 @@ filter_by_key_value(df_web_hp, "client_ip", "90.151.171.106", file_prefix=FILE_P
 unique_ips_web_hp = get_unique_values("client_ip", logs_web_hp)
 print(f"Number of distinct IPs: {len(unique_ips_web_hp)}")
 
+print("============================== Correlation ==============================")
 
+FILE_PREFIX_CORRELATION = "corr-"
+correlation_summary = correlate(
+    {"cowrie": FILE_PATH_COWRIE, "ssh": FILE_PATH_SSH_HP, "web": FILE_PATH_WEB_HP},
+    file_prefix=FILE_PREFIX_CORRELATION,
+)
+print(correlation_summary)
 
 clean_ip_info_cache()
 save_ip_info_cache(ip_info_cache)
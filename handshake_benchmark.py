@@ -0,0 +1,63 @@
+import argparse
+import socket
+import time
+import paramiko
+from concurrent.futures import ThreadPoolExecutor
+from ssh_honeypot import get_host_keys, LOG_FILE
+from benchmark_utils import benchmark_log_file, start_ssh_server
+
+KEY_ALGORITHMS = {
+    "ed25519": "ssh-ed25519",
+    "ecdsa": "ecdsa-sha2-nistp256",
+    "rsa": "rsa-sha2-256",
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure SSH honeypot handshakes/sec per host key type")
+
+    parser.add_argument("-a", "--host", type=str, default="127.0.0.1")
+    parser.add_argument("-p", "--port", type=int, default=2299)
+    parser.add_argument("-n", "--handshakes", type=int, default=200)
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("--no-server", action="store_true", help="Benchmark an already running honeypot")
+    parser.add_argument("--log-file", type=str, default=benchmark_log_file(LOG_FILE))
+
+    return parser.parse_args()
+
+def handshake(host, port, key_algorithm) -> float:
+    sock = socket.create_connection((host, port), timeout=10)
+    transport = paramiko.Transport(sock)
+    try:
+        transport.get_security_options().key_types = (key_algorithm,)
+        start = time.perf_counter()
+        transport.start_client(timeout=10)
+        return time.perf_counter() - start
+    finally:
+        transport.close()
+
+def benchmark(host, port, key_algorithm, handshakes, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = sorted(executor.map(lambda _: handshake(host, port, key_algorithm), range(handshakes)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "handshakes_per_sec": handshakes / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    server = None
+    if not args.no_server:
+        server = start_ssh_server(args.host, args.port, args.log_file)
+
+    try:
+        for key_type in get_host_keys():
+            result = benchmark(args.host, args.port, KEY_ALGORITHMS[key_type], args.handshakes, args.concurrency)
+            print(f"{key_type:8} {result['handshakes_per_sec']:8.1f} handshakes/sec  p50 {result['p50_ms']:.1f} ms  p99 {result['p99_ms']:.1f} ms")
+    finally:
+        if server:
+            server.terminate()
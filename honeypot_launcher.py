@@ -1,7 +1,16 @@
+import os
+import socket
 import argparse
+import logging
 import threading
-from ssh_honeypot import start_server
-from app import run
+from ssh_honeypot import start_server, get_host_keys, LOG_FILE as SSH_LOG_FILE
+from session_manager import AUTH_TIMEOUT, IDLE_TIMEOUT, SESSION_TIMEOUT
+from app import run, app, db, LOG_FILE as WEB_LOG_FILE
+from metrics import start_metrics_server, METRICS_DEFAULT_HOST
+from log_segments import SegmentedLogHandler, setup_logging
+from supervisor import Supervisor, reuse_port_supported, create_listener
+from session_recorder import RECORDINGS_FOLDER
+from collector import EventShipper, parse_collector_address
 
 SSH = "ssh"
 SSH_DEFAULT_PORT = 2222
@@ -30,41 +39,175 @@ def parse_args():
         "-s",
         "--ssh-port",
         type=int,
-        default=SSH_DEFAULT_PORT
+        nargs="+",
+        default=[SSH_DEFAULT_PORT]
     )
     parser.add_argument(
         "-w",
         "--web-port",
         type=int,
-        default=WEB_DEFAULT_PORT
+        nargs="+",
+        default=[WEB_DEFAULT_PORT]
+    )
+    parser.add_argument(
+        "--auth-timeout",
+        type=float,
+        default=AUTH_TIMEOUT
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=IDLE_TIMEOUT
+    )
+    parser.add_argument(
+        "--session-timeout",
+        type=float,
+        default=SESSION_TIMEOUT
+    )
+    parser.add_argument(
+        "-m",
+        "--metrics-port",
+        type=int,
+        default=None
+    )
+    parser.add_argument(
+        "-r",
+        "--record-sessions",
+        type=str,
+        nargs="?",
+        const=RECORDINGS_FOLDER,
+        default=None
+    )
+    parser.add_argument(
+        "--log-all-attempts",
+        action="store_true"
+    )
+    parser.add_argument(
+        "-n",
+        "--workers",
+        type=int,
+        default=0
+    )
+    parser.add_argument(
+        "-c",
+        "--collector",
+        type=str,
+        default=None,
+        help="HOST:PORT of a collector to push events to"
+    )
+    parser.add_argument(
+        "--sensor-id",
+        type=str,
+        default=socket.gethostname()
+    )
+    parser.add_argument(
+        "--collector-token",
+        type=str,
+        default=os.environ.get("COLLECTOR_TOKEN")
     )
 
     args = parser.parse_args()
 
     return args
 
-def start_all_honeypots(host, ssh_port, web_port):
-    ssh_thread = threading.Thread(target=start_server, args=(host, ssh_port))
-    web_thread = threading.Thread(target=run, args=(host, web_port))
+def start_all_honeypots(host, ssh_ports, web_ports, shipper=None, **ssh_kwargs):
+    # One process owns one log file; like before, SSH's wins when both run.
+    # Set up before the shipper is attached, setup_logging() skips a configured root.
+    setup_logging(SSH_LOG_FILE if ssh_ports else WEB_LOG_FILE)
+    if shipper:
+        logging.getLogger().addHandler(shipper)
+    threads = [threading.Thread(target=start_server, args=(host, port), kwargs=ssh_kwargs) for port in ssh_ports]
+    threads += [threading.Thread(target=run, args=(host, port)) for port in web_ports]
+
+    for thread in threads:
+        thread.start()
+
+def run_with_metrics(target, metrics_port, *args, **kwargs):
+    if metrics_port:
+        start_metrics_server(METRICS_DEFAULT_HOST, metrics_port)
+    target(*args, **kwargs)
 
-    ssh_thread.start()
-    web_thread.start()
+def start_supervisor(host, ssh_ports, web_ports, workers, metrics_port=None, shipper=None, **ssh_kwargs):
+    """
+    Forks `workers` processes per listening port. With SO_REUSEPORT each worker
+    binds its own socket; otherwise all workers accept() on one pre-bound socket.
+    The supervisor itself serves its metrics (log writing, event shipping) on
+    metrics_port, and worker N on metrics_port + N.
+    """
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+
+    # Only lock (and rotate) the logs of the honeypots launched here, so a
+    # separately started honeypot of the other type can still own its own
+    log_files = {SSH: (ssh_ports, SSH_LOG_FILE), WEB: (web_ports, WEB_LOG_FILE)}
+    log_handlers = {honeypot_type: SegmentedLogHandler(filename) for honeypot_type, (ports, filename) in log_files.items() if ports}
+    for handler in log_handlers.values():
+        handler.setFormatter(logging.Formatter("%(message)s"))
+
+    if ssh_ports:
+        get_host_keys()  # load once in the parent so forked workers share it
+    if web_ports:
+        # Create tables once, and don't hand pooled SQLite connections to the forks
+        with app.app_context():
+            db.create_all()
+            db.engine.dispose()
+
+    if metrics_port:
+        start_metrics_server(METRICS_DEFAULT_HOST, metrics_port)
+
+    supervisor = Supervisor(log_handlers, [shipper] if shipper else None)
+    reuse_port = reuse_port_supported()
+    worker_number = 0
+
+    for honeypot_type, ports, target, kwargs in [(SSH, ssh_ports, start_server, ssh_kwargs), (WEB, web_ports, run, {})]:
+        for port in ports:
+            listener = {"reuse_port": True} if reuse_port else {"sock": create_listener(host, port)}
+            for i in range(workers):
+                worker_number += 1
+                worker_metrics_port = metrics_port + worker_number if metrics_port else None
+                supervisor.add_worker(f"{honeypot_type}-{port}-{i}", honeypot_type, run_with_metrics, target, worker_metrics_port, host, port, **kwargs, **listener)
+
+    supervisor.run()
 
 if __name__ == "__main__":
     try:
         args = parse_args()
+        ssh_options = {
+            "auth_timeout": args.auth_timeout,
+            "idle_timeout": args.idle_timeout,
+            "session_timeout": args.session_timeout,
+            "record_folder": args.record_sessions,
+            "aggregate_credentials": not args.log_all_attempts,
+        }
+
+        ssh_ports = args.ssh_port if args.type in (ALL, SSH) else []
+        web_ports = args.web_port if args.type in (ALL, WEB) else []
 
-        if args.type == "all":
-            print(f"Starting all honeypots on {args.host}\n\tSSH on port {args.ssh_port}\n\tWeb on port {args.web_port}")
-            start_all_honeypots(args.host, args.ssh_port, args.web_port)
-        elif args.type == SSH:
-            print(f"Starting SSH honeypot on {args.host}:{args.ssh_port}")
-            start_server(host=args.host, port=args.ssh_port)
-        elif args.type == WEB:
-            print(f"Starting Web honeypot on {args.host}:{args.web_port}")
-            run(host=args.host, port=args.web_port)
+        shipper = None
+        if args.collector:
+            shipper = EventShipper(*parse_collector_address(args.collector), args.sensor_id, token=args.collector_token)
+            print(f"Shipping events to collector {args.collector} as sensor {args.sensor_id}")
+
+        if args.workers > 0:
+            print(f"Starting supervisor on {args.host} with {args.workers} worker(s) per port\n\tSSH on ports {ssh_ports}\n\tWeb on ports {web_ports}")
+            start_supervisor(args.host, ssh_ports, web_ports, args.workers, args.metrics_port, shipper, **ssh_options)
         else:
-            print("Please specify honeypot type")
+            if args.metrics_port:
+                start_metrics_server(METRICS_DEFAULT_HOST, args.metrics_port)
+
+            if args.type == "all":
+                print(f"Starting all honeypots on {args.host}\n\tSSH on ports {ssh_ports}\n\tWeb on ports {web_ports}")
+                start_all_honeypots(args.host, ssh_ports, web_ports, shipper, **ssh_options)
+            elif args.type == SSH:
+                print(f"Starting SSH honeypot on {args.host}:{ssh_ports}")
+                start_all_honeypots(args.host, ssh_ports, [], shipper, **ssh_options)
+            elif args.type == WEB:
+                print(f"Starting Web honeypot on {args.host}:{web_ports}")
+                start_all_honeypots(args.host, [], web_ports, shipper)
+            else:
+                print("Please specify honeypot type")
 
     except Exception as e:
         print(e)
\ No newline at end of file
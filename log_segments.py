@@ -0,0 +1,394 @@
+import io
+import os
+import re
+import glob
+import gzip
+import json
+import time
+import datetime
+import logging
+import threading
+from collections import Counter
+from typing import List, Dict, Any, Iterator, Optional, Union, Tuple
+import metrics
+
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+LOG_MAX_BYTES = 64 * 1024 * 1024
+LOG_ROTATE_INTERVAL = 24 * 60 * 60  # seconds
+LOG_COMPRESSION = "gzip"
+INDEX_SUFFIX = ".idx.json"
+INDEX_CHECKPOINT_EVERY = 1000  # events between byte offset checkpoints
+LOCK_SUFFIX = ".lock"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+COMPRESSED_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+LOG_WRITE_SECONDS = metrics.histogram("honeypot_log_write_seconds", "Time spent writing one log record")
+LOG_SEGMENTS_PENDING = metrics.gauge("honeypot_log_segments_pending", "Closed log segments waiting to be compressed and indexed")
+
+# Paths of rotated segments still being compressed
+pending_segments = set()
+
+def format_timestamp(ts: float) -> str:
+    return datetime.datetime.fromtimestamp(ts).strftime(TIMESTAMP_FORMAT)[:-3]
+
+def to_timestamp_str(value: Union[str, datetime.datetime, None]) -> Optional[str]:
+    if isinstance(value, datetime.datetime):
+        return value.strftime(TIMESTAMP_FORMAT)[:-3]
+    return value
+
+class SegmentStats:
+    def __init__(self):
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.events = 0
+        self.bytes = 0
+        self.event_types = Counter()
+        self.checkpoints = []
+
+    def add(self, timestamp: str, event_type: str, size: int):
+        if self.events % INDEX_CHECKPOINT_EVERY == 0:
+            # Newest timestamp before this offset, so late (e.g. spooled) events can't be skipped
+            self.checkpoints.append([self.last_timestamp or timestamp, self.bytes])
+        if self.first_timestamp is None or timestamp < self.first_timestamp:
+            self.first_timestamp = timestamp
+        if self.last_timestamp is None or timestamp > self.last_timestamp:
+            self.last_timestamp = timestamp
+        self.events += 1
+        self.bytes += size
+        self.event_types[event_type] += 1
+
+    def to_dict(self, segment: str, compression: Optional[str]) -> Dict[str, Any]:
+        return {
+            "segment": segment,
+            "compression": compression,
+            "first_timestamp": self.first_timestamp,
+            "last_timestamp": self.last_timestamp,
+            "events": self.events,
+            "bytes": self.bytes,
+            "event_types": dict(self.event_types),
+            "offsets": self.checkpoints,
+        }
+
+def scan_segment(file_path: str) -> SegmentStats:
+    """Rebuild stats for a log file whose index is missing (written before segmenting, or orphaned by a crash)."""
+    stats = SegmentStats()
+    with open_segment(file_path) as f:
+        for raw in f:
+            try:
+                entry = json.loads(raw)
+                timestamp = entry.get("timestamp")
+                event_type = entry.get("event_type", "generic_event")
+            except (json.JSONDecodeError, UnicodeDecodeError, AttributeError):
+                timestamp, event_type = None, "other"
+            if timestamp is None:
+                timestamp = stats.last_timestamp or format_timestamp(os.path.getmtime(file_path))
+            stats.add(timestamp, event_type, len(raw))
+    return stats
+
+def compress_segment(file_path: str, compression: str = LOG_COMPRESSION) -> str:
+    if compression == "zstd" and zstd is None:
+        compression = "gzip"
+
+    out_path = file_path + COMPRESSED_EXTENSIONS[compression]
+    with open(file_path, "rb") as src:
+        if compression == "zstd":
+            with open(out_path, "wb") as dst:
+                zstd.ZstdCompressor().copy_stream(src, dst)
+        else:
+            with gzip.open(out_path, "wb") as dst:
+                while chunk := src.read(1024 * 1024):
+                    dst.write(chunk)
+    os.remove(file_path)
+    return out_path
+
+def write_index(file_path: str, segment_path: str, stats: SegmentStats):
+    compression = next((name for name, ext in COMPRESSED_EXTENSIONS.items() if segment_path.endswith(ext)), None)
+    index_path = file_path + INDEX_SUFFIX
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(stats.to_dict(os.path.basename(segment_path), compression), f, indent=4)
+    os.replace(tmp_path, index_path)
+
+def close_segment(file_path: str, stats: Optional[SegmentStats], compression: Optional[str] = LOG_COMPRESSION):
+    try:
+        if stats is None:
+            stats = scan_segment(file_path)
+        segment_path = compress_segment(file_path, compression) if compression else file_path
+        write_index(file_path, segment_path, stats)
+    except Exception as e:
+        print(f"ERROR close_segment({file_path}): {e}")
+    finally:
+        pending_segments.discard(file_path)
+
+class SegmentedLogHandler(logging.Handler):
+    """
+    Writes log records to `filename`, rolling it over into a numbered segment once
+    it grows past `max_bytes` or is older than `interval` seconds. Closed segments
+    are compressed in the background and get a small JSON index next to them.
+    """
+
+    def __init__(self, filename: str, max_bytes: int = LOG_MAX_BYTES, interval: int = LOG_ROTATE_INTERVAL, compression: Optional[str] = LOG_COMPRESSION):
+        super().__init__()
+        self.filename = os.path.abspath(filename)
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.compression = compression
+        self.stream = None
+        self.stats = SegmentStats()
+        self.opened_at = time.time()
+        self.threads: List[threading.Thread] = []
+
+        # One writer per file: a second process appending would have its lines
+        # rotated away under it and would corrupt the owner's index offsets.
+        self.lock_file = None
+        if not self.acquire_file_lock():
+            raise RuntimeError(f"{self.filename} is already being written by another process")
+        self.recover_segments()
+        if os.path.exists(self.filename) and os.path.getsize(self.filename) > 0:
+            self.stats = scan_segment(self.filename)
+            self.rollover()
+        self.open()
+
+    def acquire_file_lock(self) -> bool:
+        if fcntl is None:
+            return True
+        self.lock_file = open(self.filename + LOCK_SUFFIX, "a")
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            self.lock_file.close()
+            self.lock_file = None
+            return False
+
+    def recover_segments(self):
+        """Indexes (and compresses) segments a previous process rotated but never finished closing."""
+        for segment in list_segments(self.filename):
+            if segment.get("indexed"):
+                continue
+            plain_path = segment["plain_path"]
+            if os.path.exists(plain_path):
+                # A compressed file next to the plain one is a partial write
+                for ext in COMPRESSED_EXTENSIONS.values():
+                    if os.path.exists(plain_path + ext):
+                        os.remove(plain_path + ext)
+                self.close_in_background(plain_path, None)
+            else:
+                self.close_in_background(plain_path, None, segment["path"])
+
+    def close_in_background(self, plain_path: str, stats: Optional[SegmentStats], compressed_path: Optional[str] = None):
+        pending_segments.add(plain_path)
+        if compressed_path:
+            target, args = index_segment, (plain_path, compressed_path)
+        else:
+            target, args = close_segment, (plain_path, stats, self.compression)
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        self.threads = [t for t in self.threads if t.is_alive()] + [thread]
+
+    def open(self):
+        self.stream = open(self.filename, "ab")
+        self.stats = SegmentStats()
+        self.opened_at = time.time()
+
+    def should_rollover(self, size: int) -> bool:
+        if self.stats.events == 0:
+            return False
+        if self.max_bytes and self.stats.bytes + size > self.max_bytes:
+            return True
+        return bool(self.interval) and time.time() - self.opened_at >= self.interval
+
+    def segment_name(self) -> str:
+        first = self.stats.first_timestamp or format_timestamp(self.opened_at)
+        stamp = datetime.datetime.strptime(first, TIMESTAMP_FORMAT).strftime("%Y%m%d-%H%M%S")
+        name = f"{self.filename}.{stamp}"
+        counter = 1
+        while glob.glob(glob.escape(name) + "*"):
+            name = f"{self.filename}.{stamp}-{counter}"
+            counter += 1
+        return name
+
+    def rollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        segment_path = self.segment_name()
+        os.rename(self.filename, segment_path)
+        self.close_in_background(segment_path, self.stats)
+
+    def write_many(self, entries: List[Tuple[bytes, str, str]]):
+        """Appends pre-formatted (line, timestamp, event_type) entries with a single flush."""
+        with self.lock, LOG_WRITE_SECONDS.time():
+            for data, timestamp, event_type in entries:
+                if self.should_rollover(len(data)):
+                    self.rollover()
+                    self.open()
+                self.stream.write(data)
+                self.stats.add(timestamp, event_type, len(data))
+            self.stream.flush()
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            data = (self.format(record) + "\n").encode("utf-8")
+            event_type = getattr(record, "event_type", None) or record.levelname.lower()
+            self.write_many([(data, format_timestamp(record.created), event_type)])
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        with self.lock:
+            if self.stream:
+                self.stream.close()
+                self.stream = None
+        # Let compression finish so shutdown doesn't leave half-closed segments
+        for thread in self.threads:
+            thread.join()
+        if self.lock_file:
+            self.lock_file.close()
+            self.lock_file = None
+        super().close()
+
+def collect_log_metrics():
+    LOG_SEGMENTS_PENDING.set(len(pending_segments))
+
+metrics.register_collector(collect_log_metrics)
+
+def setup_logging(filename: str, level=logging.INFO, format="%(message)s", **kwargs):
+    # Same first-caller-wins behaviour as logging.basicConfig(filename=...)
+    if logging.getLogger().handlers:
+        return
+    handler = SegmentedLogHandler(filename, **kwargs)
+    handler.setFormatter(logging.Formatter(format))
+    logging.basicConfig(level=level, handlers=[handler])
+
+def open_segment(file_path: str):
+    if file_path.endswith(".gz"):
+        return gzip.open(file_path, "rb")
+    if file_path.endswith(".zst"):
+        if zstd is None:
+            raise RuntimeError(f"zstandard is required to read {file_path}")
+        return io.BufferedReader(zstd.ZstdDecompressor().stream_reader(open(file_path, "rb"), closefd=True))
+    return open(file_path, "rb")
+
+def index_segment(file_path: str, segment_path: str):
+    """Writes the index of an already compressed segment."""
+    try:
+        write_index(file_path, segment_path, scan_segment(segment_path))
+    except Exception as e:
+        print(f"ERROR index_segment({segment_path}): {e}")
+    finally:
+        pending_segments.discard(file_path)
+
+def load_indexes(file_path: str) -> List[Dict[str, Any]]:
+    indexes = []
+    directory = os.path.dirname(os.path.abspath(file_path))
+    for index_path in glob.glob(glob.escape(file_path) + ".*" + INDEX_SUFFIX):
+        try:
+            with open(index_path, 'r') as f:
+                index = json.load(f)
+            index["path"] = os.path.join(directory, index["segment"])
+            index["plain_path"] = index_path[:-len(INDEX_SUFFIX)]
+            index["indexed"] = True
+            indexes.append(index)
+        except Exception as e:
+            print(f"ERROR loading index {index_path}: {e}")
+    return sorted(indexes, key=lambda index: index["first_timestamp"] or "")
+
+def list_segments(file_path: str) -> List[Dict[str, Any]]:
+    """
+    All segments rotated out of `file_path`, oldest first. Segments without an
+    index (still being compressed, or orphaned by a crash) are included with an
+    unknown time range so readers never skip them.
+    """
+    file_path = os.path.abspath(file_path)
+    pattern = re.compile(re.escape(os.path.basename(file_path)) + r"\.(\d{8}-\d{6})(-\d+)?(\.gz|\.zst)?$")
+    segments = {index["plain_path"]: index for index in load_indexes(file_path)}
+
+    for path in glob.glob(glob.escape(file_path) + ".*"):
+        match = pattern.match(os.path.basename(path))
+        if not match:
+            continue
+        plain_path = path[:len(path) - len(match.group(3) or "")]
+        existing = segments.get(plain_path)
+        # Prefer the plain file while compression is still writing the compressed one
+        if existing is None or (not existing.get("indexed") and path == plain_path):
+            stamp = datetime.datetime.strptime(match.group(1), "%Y%m%d-%H%M%S").strftime(TIMESTAMP_FORMAT)[:-3]
+            segments[plain_path] = {"path": path, "plain_path": plain_path, "sort_key": stamp + (match.group(2) or ""), "first_timestamp": None, "last_timestamp": None, "offsets": []}
+
+    return sorted(segments.values(), key=lambda segment: segment.get("sort_key") or segment["first_timestamp"] or "")
+
+def in_window(index: Dict[str, Any], start: Optional[str], end: Optional[str]) -> bool:
+    if start and index["last_timestamp"] and index["last_timestamp"] < start:
+        return False
+    if end and index["first_timestamp"] and index["first_timestamp"] > end:
+        return False
+    return True
+
+def start_offset(index: Dict[str, Any], start: Optional[str]) -> int:
+    offset = 0
+    if start:
+        for timestamp, checkpoint in index.get("offsets", []):
+            if timestamp >= start:
+                break
+            offset = checkpoint
+    return offset
+
+def skip_to(f, offset: int):
+    if f.seekable():
+        f.seek(offset)
+        return
+    # zstd streams can only be read forward
+    while offset > 0:
+        chunk = f.read(min(offset, 1024 * 1024))
+        if not chunk:
+            break
+        offset -= len(chunk)
+
+def iter_segment_lines(file_path: str, offset: int = 0) -> Iterator[str]:
+    with open_segment(file_path) as f:
+        if offset:
+            skip_to(f, offset)
+        for raw in f:
+            yield raw.decode("utf-8", errors="replace")
+
+def iter_unindexed_segment_lines(segment: Dict[str, Any]) -> Iterator[str]:
+    # Compression may remove the plain file between listing and opening it
+    for path in [segment["path"]] + [segment["plain_path"] + ext for ext in COMPRESSED_EXTENSIONS.values()]:
+        try:
+            f = open_segment(path)
+        except FileNotFoundError:
+            continue
+        with f:
+            for raw in f:
+                yield raw.decode("utf-8", errors="replace")
+        return
+
+def iter_log_lines(file_path: str, start: Union[str, datetime.datetime, None] = None, end: Union[str, datetime.datetime, None] = None) -> Iterator[str]:
+    """
+    Yields the lines of `file_path` and of every closed segment rotated out of it,
+    oldest first. Segments whose index lies entirely outside [start, end] are not
+    opened at all. Compressed segments are decompressed transparently.
+    """
+    start, end = to_timestamp_str(start), to_timestamp_str(end)
+
+    if file_path.endswith(tuple(COMPRESSED_EXTENSIONS.values())):
+        yield from iter_segment_lines(file_path)
+        return
+
+    for segment in list_segments(file_path):
+        if not segment.get("indexed"):
+            yield from iter_unindexed_segment_lines(segment)
+        elif in_window(segment, start, end):
+            yield from iter_segment_lines(segment["path"], start_offset(segment, start))
+    if os.path.exists(file_path):
+        yield from iter_segment_lines(file_path)
@@ -0,0 +1,139 @@
+import os
+import time
+import threading
+import itertools
+from collections import Counter
+from typing import Dict, Any, Optional
+import metrics
+
+AUTH_TIMEOUT = 30  # seconds from connect until a channel is opened
+IDLE_TIMEOUT = 300  # seconds without any input on an open channel
+SESSION_TIMEOUT = 30 * 60  # seconds since connect, regardless of activity
+REAPER_INTERVAL = 5
+
+SSH_SESSIONS_CLOSED = metrics.counter("ssh_sessions_closed_total", "SSH sessions closed since start, by reason")
+
+def count_open_fds() -> Optional[int]:
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+class Session:
+    def __init__(self, session_id: int, client, addr):
+        self.id = session_id
+        self.client = client
+        self.client_ip = addr[0]
+        self.port = addr[1]
+        self.transport = None
+        self.channel = None
+        self.recorder = None
+        self.created_at = time.monotonic()
+        self.last_activity = self.created_at
+        self.close_reason = None
+
+    def touch(self):
+        self.last_activity = time.monotonic()
+
+    def expired_reason(self, now: float, auth_timeout: float, idle_timeout: float, session_timeout: float) -> Optional[str]:
+        if session_timeout and now - self.created_at > session_timeout:
+            return "session_timeout"
+        if self.channel is None:
+            if auth_timeout and now - self.created_at > auth_timeout:
+                return "auth_timeout"
+        elif idle_timeout and now - self.last_activity > idle_timeout:
+            return "idle_timeout"
+        return None
+
+    def close(self, reason: str):
+        if self.close_reason is None:
+            self.close_reason = reason
+        # Closing the transport also closes its channels, which wakes up any
+        # worker blocked in accept() or recv().
+        for closeable in (self.channel, self.transport, self.client):
+            if closeable is None:
+                continue
+            try:
+                closeable.close()
+            except Exception:
+                pass
+
+class SessionManager:
+    """
+    Tracks every open SSH connection and closes the ones that stall in the
+    handshake, sit idle, or run past the total session limit.
+    """
+
+    def __init__(self, auth_timeout: float = AUTH_TIMEOUT, idle_timeout: float = IDLE_TIMEOUT, session_timeout: float = SESSION_TIMEOUT, reaper_interval: float = REAPER_INTERVAL, on_reap=None):
+        self.auth_timeout = auth_timeout
+        self.idle_timeout = idle_timeout
+        self.session_timeout = session_timeout
+        self.reaper_interval = reaper_interval
+        self.on_reap = on_reap
+        self.sessions: Dict[int, Session] = {}
+        self.lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self.reinit_lock)
+        self.ids = itertools.count(1)
+        self.sessions_total = 0
+        self.closed_reasons = Counter()
+        self.reaper_thread = None
+        self.stop_event = threading.Event()
+
+    def open(self, client, addr) -> Session:
+        session = Session(next(self.ids), client, addr)
+        with self.lock:
+            self.sessions[session.id] = session
+            self.sessions_total += 1
+        return session
+
+    def reinit_lock(self):
+        # Supervisor workers are forked from a multi-threaded parent
+        self.lock = threading.Lock()
+
+    def release(self, session: Session, reason: str = "closed"):
+        session.close(reason)
+        with self.lock:
+            if self.sessions.pop(session.id, None) is None:
+                return
+            self.closed_reasons[session.close_reason] += 1
+        SSH_SESSIONS_CLOSED.inc(reason=session.close_reason)
+
+    def reap(self):
+        now = time.monotonic()
+        with self.lock:
+            sessions = list(self.sessions.values())
+
+        for session in sessions:
+            reason = session.expired_reason(now, self.auth_timeout, self.idle_timeout, self.session_timeout)
+            if reason:
+                if self.on_reap:
+                    self.on_reap(session, reason)
+                self.release(session, reason)
+
+    def run_reaper(self):
+        while not self.stop_event.wait(self.reaper_interval):
+            try:
+                self.reap()
+            except Exception as e:
+                print(f"ERROR reap(): {e}")
+
+    def start_reaper(self):
+        if self.reaper_thread is None or not self.reaper_thread.is_alive():
+            self.stop_event.clear()
+            self.reaper_thread = threading.Thread(target=self.run_reaper, daemon=True)
+            self.reaper_thread.start()
+
+    def stop_reaper(self):
+        self.stop_event.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "sessions_active": len(self.sessions),
+                "sessions_authenticating": sum(1 for s in self.sessions.values() if s.channel is None),
+                "sessions_total": self.sessions_total,
+                "sessions_closed": dict(self.closed_reasons),
+                "open_fds": count_open_fds(),
+                "threads_active": threading.active_count(),
+            }
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import struct
+import datetime
+import threading
+from typing import List, Dict, Any, Tuple, Iterator
+
+RECORDINGS_FOLDER = "ttylogs"
+MAGIC = b"HPTTY\x01"
+
+# op, direction, channel id, microseconds since session start, payload length
+RECORD = struct.Struct("<BBHQI")
+OP_OPEN = 1  # payload: JSON session metadata
+OP_AUTH = 2  # payload: username \0 password
+OP_DATA = 3
+OP_CLOSE = 4
+
+INPUT = 0
+OUTPUT = 1
+
+# Bytes in the same direction arriving within this window are stored as one
+# record, so char-at-a-time shells don't cost a header per keystroke.
+COALESCE_USEC = 20_000
+MAX_RECORD_BYTES = 64 * 1024
+
+class SessionRecorder:
+    """Writes a timestamped binary log of everything sent and received on a session, like ttylog."""
+
+    def __init__(self, file_path: str, metadata: Dict[str, Any]):
+        self.file_path = file_path
+        self.file = open(file_path, "wb")
+        self.file.write(MAGIC)
+        self.start = time.monotonic()
+        self.lock = threading.Lock()
+        self.pending = {}  # (direction, channel id) -> [start usec, last usec, bytearray]
+        self.write(OP_OPEN, INPUT, 0, 0, json.dumps(metadata).encode("utf-8"))
+
+    def now(self) -> int:
+        return int((time.monotonic() - self.start) * 1_000_000)
+
+    def write(self, op: int, direction: int, chanid: int, usec: int, payload: bytes = b""):
+        self.file.write(RECORD.pack(op, direction, chanid, usec, len(payload)))
+        self.file.write(payload)
+
+    def flush_pending(self, key=None):
+        for pending_key in [key] if key else list(self.pending):
+            pending = self.pending.pop(pending_key, None)
+            if pending:
+                self.write(OP_DATA, pending_key[0], pending_key[1], pending[0], bytes(pending[2]))
+
+    def record(self, direction: int, data: bytes, chanid: int = 0):
+        if not data:
+            return
+        with self.lock:
+            if self.file.closed:
+                return
+            usec = self.now()
+            key = (direction, chanid)
+            pending = self.pending.get(key)
+            if pending and (usec - pending[1] > COALESCE_USEC or len(pending[2]) + len(data) > MAX_RECORD_BYTES):
+                self.flush_pending(key)
+                pending = None
+            if pending is None:
+                self.pending[key] = [usec, usec, bytearray(data)]
+            else:
+                pending[1] = usec
+                pending[2] += data
+
+    def record_auth(self, username: str, password: str):
+        with self.lock:
+            if not self.file.closed:
+                self.write(OP_AUTH, INPUT, 0, self.now(), f"{username}\0{password}".encode("utf-8"))
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            self.flush_pending()
+            self.write(OP_CLOSE, INPUT, 0, self.now())
+            self.file.close()
+
+class RecordedChannel:
+    """Wraps a paramiko.Channel so the shell code records I/O without knowing about it."""
+
+    def __init__(self, channel, recorder: SessionRecorder):
+        self.channel = channel
+        self.recorder = recorder
+
+    def recv(self, nbytes: int) -> bytes:
+        data = self.channel.recv(nbytes)
+        self.recorder.record(INPUT, data, self.channel.get_id())
+        return data
+
+    def send(self, data) -> int:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        sent = self.channel.send(data)
+        self.recorder.record(OUTPUT, data[:sent], self.channel.get_id())
+        return sent
+
+    def __getattr__(self, name):
+        return getattr(self.channel, name)
+
+def open_recorder(client_ip: str, port: int, session_id: int, folder: str = RECORDINGS_FOLDER) -> SessionRecorder:
+    os.makedirs(folder, exist_ok=True)
+    started = datetime.datetime.now()
+    filename = f"{started.strftime('%Y%m%d-%H%M%S')}-{client_ip}-{port}-{session_id}.ttylog"
+    metadata = {
+        "timestamp": started.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+        "client_ip": client_ip,
+        "port": port,
+        "session_id": session_id,
+    }
+    return SessionRecorder(os.path.join(folder, filename), metadata)
+
+def iter_records(file_path: str) -> Iterator[Tuple[int, int, int, int, bytes]]:
+    with open(file_path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{file_path} is not a session recording")
+        while header := f.read(RECORD.size):
+            if len(header) < RECORD.size:
+                break  # truncated by a crash mid-write
+            op, direction, chanid, usec, length = RECORD.unpack(header)
+            yield op, direction, chanid, usec, f.read(length)
+
+def read_recording(file_path: str) -> Dict[str, Any]:
+    recording = {"metadata": {}, "auth": [], "input": [], "output": [], "duration_usec": 0}
+    for op, direction, chanid, usec, payload in iter_records(file_path):
+        if op == OP_OPEN:
+            recording["metadata"] = json.loads(payload)
+        elif op == OP_AUTH:
+            recording["auth"].append(tuple(payload.decode("utf-8", errors="replace").split("\0", 1)))
+        elif op == OP_DATA:
+            recording["input" if direction == INPUT else "output"].append((usec, chanid, payload))
+        recording["duration_usec"] = max(recording["duration_usec"], usec)
+
+    # Coalesced records are written when they are flushed, not when they start
+    recording["input"].sort(key=lambda record: record[0])
+    recording["output"].sort(key=lambda record: record[0])
+    return recording
+
+def list_recordings(folder: str = RECORDINGS_FOLDER) -> List[str]:
+    return sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".ttylog"))
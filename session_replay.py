@@ -0,0 +1,193 @@
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+import itertools
+import paramiko
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+from session_recorder import RECORDINGS_FOLDER, read_recording, list_recordings
+from benchmark_utils import benchmark_log_file, start_ssh_server
+
+PROMPT = b"$ "
+DEFAULT_CREDENTIALS = [("user", "password123")]
+RSS_SAMPLE_INTERVAL = 0.05
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay recorded attacker sessions against the SSH honeypot")
+
+    parser.add_argument("recordings", type=str, nargs="?", default=RECORDINGS_FOLDER)
+    parser.add_argument("-a", "--host", type=str, default="127.0.0.1")
+    parser.add_argument("-p", "--port", type=int, default=2298)
+    parser.add_argument("-n", "--sessions", type=int, default=1000)
+    parser.add_argument("-c", "--concurrency", type=int, default=100)
+    parser.add_argument("--speed", type=float, default=0, help="Replay speed multiplier, 0 replays without delays")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--no-server", action="store_true", help="Replay against an already running honeypot")
+    parser.add_argument("--log-file", type=str, default=benchmark_log_file("hp-ssh.log"))
+
+    return parser.parse_args()
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def read_rss_kb(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+class RSSSampler(threading.Thread):
+    def __init__(self, pid: int):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.peak = read_rss_kb(pid) or 0
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.wait(RSS_SAMPLE_INTERVAL):
+            self.peak = max(self.peak, read_rss_kb(self.pid) or 0)
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+def wait_for_prompts(channel: paramiko.Channel, buffer: bytearray, count: int, deadline: float) -> List[float]:
+    """Reads until `count` prompts arrived (or the channel closed) and returns when each one did."""
+    arrivals = []
+    while len(arrivals) < count:
+        while PROMPT in buffer and len(arrivals) < count:
+            del buffer[:buffer.index(PROMPT) + len(PROMPT)]
+            arrivals.append(time.perf_counter())
+        if len(arrivals) >= count:
+            break
+        channel.settimeout(max(0.01, deadline - time.perf_counter()))
+        data = channel.recv(4096)
+        if not data:
+            break
+        buffer += data
+    return arrivals
+
+def replay_session(host: str, port: int, recording: Dict[str, Any], speed: float = 0, timeout: float = 30) -> Dict[str, Any]:
+    result = {"handshake": None, "commands": [], "authenticated": False, "error": None}
+    deadline = time.perf_counter() + timeout
+    transport = None
+
+    try:
+        start = time.perf_counter()
+        sock = socket.create_connection((host, port), timeout=timeout)
+        transport = paramiko.Transport(sock)
+        transport.start_client(timeout=timeout)
+        result["handshake"] = time.perf_counter() - start
+
+        for username, password in recording["auth"] or DEFAULT_CREDENTIALS:
+            try:
+                transport.auth_password(username, password)
+            except paramiko.AuthenticationException:
+                continue
+            if transport.is_authenticated():
+                result["authenticated"] = True
+                break
+        if not result["authenticated"]:
+            return result
+
+        channel = transport.open_session(timeout=timeout)
+        channel.get_pty()
+        channel.invoke_shell()
+        buffer = bytearray()
+        wait_for_prompts(channel, buffer, 1, deadline)
+
+        replay_start = time.perf_counter()
+        first_usec = recording["input"][0][0] if recording["input"] else 0
+        for usec, _, data in recording["input"]:
+            if speed:
+                delay = (usec - first_usec) / 1_000_000 / speed - (time.perf_counter() - replay_start)
+                if delay > 0:
+                    time.sleep(delay)
+
+            sent_at = time.perf_counter()
+            channel.sendall(data)
+            commands = data.count(b"\r")
+            if commands:
+                arrivals = wait_for_prompts(channel, buffer, commands, deadline)
+                result["commands"].extend(arrival - sent_at for arrival in arrivals)
+                if len(arrivals) < commands:
+                    break  # the shell exited or timed out
+            if channel.closed or time.perf_counter() > deadline:
+                break
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if transport:
+            transport.close()
+    return result
+
+def benchmark(host: str, port: int, recordings: List[Dict[str, Any]], sessions: int, concurrency: int, speed: float = 0, timeout: float = 30, server_pid: Optional[int] = None) -> Dict[str, Any]:
+    sampler = RSSSampler(server_pid) if server_pid else None
+    baseline_rss = sampler.peak if sampler else None
+    if sampler:
+        sampler.start()
+
+    start = time.perf_counter()
+    session_recordings = itertools.islice(itertools.cycle(recordings), sessions)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda recording: replay_session(host, port, recording, speed, timeout), session_recordings))
+    elapsed = time.perf_counter() - start
+
+    if sampler:
+        sampler.stop()
+
+    handshakes = [r["handshake"] for r in results if r["handshake"] is not None]
+    commands = [latency for r in results for latency in r["commands"]]
+    report = {
+        "sessions": len(results),
+        "errors": sum(1 for r in results if r["error"]),
+        "auth_failures": sum(1 for r in results if r["handshake"] is not None and not r["authenticated"]),
+        "elapsed_sec": elapsed,
+        "sessions_per_sec": len(results) / elapsed,
+        "commands": len(commands),
+    }
+    for name, values in (("handshake", handshakes), ("command", commands)):
+        for p in (0.5, 0.9, 0.99):
+            value = percentile(values, p)
+            report[f"{name}_p{int(p * 100)}_ms"] = value * 1000 if value is not None else None
+    if sampler:
+        report["server_peak_rss_kb"] = sampler.peak
+        report["memory_per_session_kb"] = (sampler.peak - baseline_rss) / min(concurrency, sessions)
+
+    first_error = next((r["error"] for r in results if r["error"]), None)
+    if first_error:
+        report["first_error"] = first_error
+    return report
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    paths = list_recordings(args.recordings) if os.path.isdir(args.recordings) else [args.recordings]
+    recordings = [read_recording(path) for path in paths]
+    if not recordings:
+        print(f"No recordings found in {args.recordings}")
+        sys.exit(1)
+    print(f"Loaded {len(recordings)} recording(s), replaying {args.sessions} sessions with concurrency {args.concurrency}")
+
+    server = None
+    if not args.no_server:
+        server = start_ssh_server(args.host, args.port, args.log_file)
+        time.sleep(0.5)
+
+    try:
+        report = benchmark(args.host, args.port, recordings, args.sessions, args.concurrency, args.speed, args.timeout, server.pid if server else None)
+        for key, value in report.items():
+            print(f"{key:24} {value:.2f}" if isinstance(value, float) else f"{key:24} {value}")
+    finally:
+        if server:
+            server.terminate()
@@ -1,3 +1,4 @@
+import os
 import paramiko
 import threading
 import socket
@@ -5,11 +6,48 @@ import logging
 import json
 import datetime
 import traceback
+from log_segments import setup_logging
+from supervisor import create_listener
+from session_recorder import open_recorder, RecordedChannel
+from credential_aggregator import CredentialAggregator
+from session_manager import SessionManager, Session, count_open_fds, AUTH_TIMEOUT, IDLE_TIMEOUT, SESSION_TIMEOUT
+import metrics
 
 SSH_BANNER = "SSH-2.0-MySSHServer"
-host_key = paramiko.RSAKey(filename="server.key")
+LOG_FILE = "hp-ssh.log"
 
-logging.basicConfig(level=logging.INFO, format="%(message)s", filename="hp-ssh.log")
+# Key type -> (key class, key file). Only the files that exist are loaded.
+HOST_KEY_FILES = {
+    "ed25519": (paramiko.Ed25519Key, "server_ed25519.key"),
+    "ecdsa": (paramiko.ECDSAKey, "server_ecdsa.key"),
+    "rsa": (paramiko.RSAKey, "server.key"),
+}
+HOST_KEY_TYPES = ["ed25519", "ecdsa", "rsa"]
+
+# Cheapest handshakes first; group16/group-exchange are dropped since their
+# 4096-bit modexp dominates server CPU under scan floods.
+PREFERRED_KEX = (
+    "curve25519-sha256@libssh.org",
+    "ecdh-sha2-nistp256",
+    "diffie-hellman-group14-sha256",
+    "diffie-hellman-group14-sha1",
+)
+PREFERRED_KEYS = ("ssh-ed25519", "ecdsa-sha2-nistp256", "rsa-sha2-256", "rsa-sha2-512", "ssh-rsa")
+PREFERRED_CIPHERS = ("aes128-ctr", "aes128-gcm@openssh.com", "aes256-ctr", "aes256-gcm@openssh.com", "aes128-cbc")
+PREFERRED_MACS = ("hmac-sha2-256-etm@openssh.com", "hmac-sha2-256", "hmac-sha1")
+
+# paramiko logs two INFO lines of its own per failed password attempt
+logging.getLogger("paramiko").setLevel(logging.WARNING)
+
+SSH_CONNECTIONS = metrics.counter("ssh_connections_accepted_total", "TCP connections accepted by the SSH honeypot")
+SSH_AUTH_ATTEMPTS = metrics.counter("ssh_auth_attempts_total", "Password authentication attempts")
+SSH_COMMANDS = metrics.counter("ssh_commands_total", "Shell commands handled")
+SSH_COMMAND_SECONDS = metrics.histogram("ssh_command_seconds", "Time to handle one shell command")
+SSH_HANDSHAKE_SECONDS = metrics.histogram("ssh_handshake_seconds", "Time from connect until key exchange completes")
+SSH_SESSIONS = metrics.gauge("ssh_sessions", "Open SSH sessions by state")
+PROCESS_OPEN_FDS = metrics.gauge("process_open_fds", "Open file descriptors")
+PROCESS_THREADS = metrics.gauge("process_threads", "Live threads")
+SSH_CREDENTIALS_UNIQUE = metrics.gauge("ssh_credentials_unique", "Distinct (client_ip, username, password) tuples seen")
 
 def log_event(**kwargs):
     log_entry = {
@@ -23,12 +61,54 @@ def log_event(**kwargs):
     log_entry.update(extra_fields)
 
     print(log_entry)
-    logging.info(json.dumps(log_entry))
+    logging.info(json.dumps(log_entry), extra={"event_type": log_entry["event_type"]})
+
+host_keys = None
+host_keys_lock = threading.Lock()
+
+def reinit_host_keys_lock():
+    global host_keys_lock
+    host_keys_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reinit_host_keys_lock)
+
+def get_host_keys():
+    """Loads the configured host keys on first use and shares them between all sessions."""
+    global host_keys
+    if host_keys is None:
+        with host_keys_lock:
+            if host_keys is None:
+                loaded = {}
+                for key_type in HOST_KEY_TYPES:
+                    key_class, filename = HOST_KEY_FILES[key_type]
+                    try:
+                        loaded[key_type] = key_class(filename=filename)
+                    except FileNotFoundError:
+                        continue
+                if not loaded:
+                    raise FileNotFoundError(f"No SSH host key found, expected one of {[f for _, f in HOST_KEY_FILES.values()]}")
+                host_keys = loaded
+    return host_keys
+
+def supported(preferred, available):
+    return tuple(name for name in preferred if name in available)
+
+class HoneypotTransport(paramiko.Transport):
+    # Computed once at import and shared by every transport instead of each
+    # one negotiating from paramiko's full default lists.
+    _preferred_kex = supported(PREFERRED_KEX, paramiko.Transport._kex_info)
+    _preferred_keys = supported(PREFERRED_KEYS, paramiko.Transport._key_info)
+    _preferred_ciphers = supported(PREFERRED_CIPHERS, paramiko.Transport._cipher_info)
+    _preferred_macs = supported(PREFERRED_MACS, paramiko.Transport._mac_info)
+    _preferred_compression = ("none",)
 
 class SSHServer(paramiko.ServerInterface):
-    def __init__(self, client_ip):
+    def __init__(self, client_ip, session: Session = None):
         self.event = threading.Event()
         self.client_ip = client_ip
+        self.session = session
+        self.usernames = set()
 
     def check_channel_request(self, kind, chanid):
         log_event(client_ip=self.client_ip, event_type="check_channel_request", kind=kind)
@@ -37,15 +117,29 @@ class SSHServer(paramiko.ServerInterface):
         return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
 
     def get_allowed_auths(self, username):
-        log_event(client_ip=self.client_ip, event_type="get_allowed_auths", username=username)
+        # paramiko calls this after every failed attempt, only log new usernames
+        if username not in self.usernames:
+            self.usernames.add(username)
+            log_event(client_ip=self.client_ip, event_type="get_allowed_auths", username=username)
         return "password"
 
     # Login attempt
     def check_auth_password(self, username, password):
-        log_event(client_ip=self.client_ip, event_type="check_auth_password", username=username, password=password)
+        if self.session and self.session.recorder:
+            self.session.recorder.record_auth(username, password)
         if username != "user" or password != "password123":
-            log_event(client_ip=self.client_ip, event_type="login_fail", username=username, password=password)
+            SSH_AUTH_ATTEMPTS.inc(result="fail")
+            if credential_aggregator:
+                # Only the first attempt of each (ip, username, password) is logged in full
+                cid, first_seen = credential_aggregator.add(self.client_ip, username, password)
+                if first_seen:
+                    log_event(client_ip=self.client_ip, event_type="login_fail", username=username, password=password, credential_id=cid)
+            else:
+                log_event(client_ip=self.client_ip, event_type="check_auth_password", username=username, password=password)
+                log_event(client_ip=self.client_ip, event_type="login_fail", username=username, password=password)
             return paramiko.AUTH_FAILED
+        SSH_AUTH_ATTEMPTS.inc(result="success")
+        log_event(client_ip=self.client_ip, event_type="check_auth_password", username=username, password=password)
         log_event(client_ip=self.client_ip, event_type="login_success", username=username, password=password)
         return paramiko.AUTH_SUCCESSFUL
 
@@ -67,6 +161,7 @@ def handle_command(command: bytes, channel: paramiko.Channel, client_ip):
     if command == b"exit":
         log_event(client_ip=client_ip, event_type="connection_closed")
         channel.close()
+        return
     elif command == b"pwd":
         response += b"/home/user"
     elif command == b"ls":
@@ -82,68 +177,145 @@ def handle_command(command: bytes, channel: paramiko.Channel, client_ip):
     print(f"{response = }")
     log_event(client_ip=client_ip, event_type="command", command=command.decode("utf-8").strip(), response=response.decode("utf-8").strip())
 
-def handle_shell_session(channel: paramiko.Channel, client_ip):
+def handle_shell_session(channel: paramiko.Channel, client_ip, session: Session = None):
     channel.send(b"$ ")
     command = b""
     while True:
         char = channel.recv(1)
-        channel.send(char)
         if not char:
+            # Client went away or the reaper closed the channel
             channel.close()
+            return
+        if session:
+            session.touch()
+        channel.send(char)
 
         command += char
         print(f"{command = }")
 
         if char == b"\r":
-            handle_command(command, channel, client_ip)
+            SSH_COMMANDS.inc()
+            with SSH_COMMAND_SECONDS.time():
+                handle_command(command, channel, client_ip)
+            if channel.closed:
+                return
             channel.send(b"$ ")
             command = b""
 
+def log_reaped_session(session: Session, reason: str):
+    log_event(client_ip=session.client_ip, port=session.port, event_type="session_reaped", reason=reason)
+
+session_manager = SessionManager(on_reap=log_reaped_session)
+
+# Folder for ttylog-style session recordings, None disables recording
+recordings_folder = None
+
+def log_credential_summary(counts, window_start, window_end):
+    if counts:
+        log_event(
+            event_type="login_fail_summary",
+            window_start=datetime.datetime.fromtimestamp(window_start).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+            window_end=datetime.datetime.fromtimestamp(window_end).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+            counts=counts,
+        )
+
+# Set by start_server(), None logs every failed attempt in full
+credential_aggregator = None
+
+def collect_credential_metrics():
+    if credential_aggregator:
+        SSH_CREDENTIALS_UNIQUE.set(credential_aggregator.stats()["credentials_unique"])
+
+def collect_session_metrics():
+    stats = session_manager.stats()
+    SSH_SESSIONS.set(stats["sessions_active"] - stats["sessions_authenticating"], state="shell")
+    SSH_SESSIONS.set(stats["sessions_authenticating"], state="authenticating")
+
+def collect_process_metrics():
+    open_fds = count_open_fds()
+    if open_fds is not None:
+        PROCESS_OPEN_FDS.set(open_fds)
+    PROCESS_THREADS.set(threading.active_count())
+
+# Process metrics are meaningful in the supervisor too, the SSH ones only where start_server() runs
+metrics.register_collector(collect_process_metrics)
+
 def handle_client(client, addr):
     log_event(client_ip=addr[0], port=addr[1], event_type="client_connection")
+    session = session_manager.open(client, addr)
 
     try:
-        transport = paramiko.Transport(client)
+        if recordings_folder:
+            session.recorder = open_recorder(addr[0], addr[1], session.id, recordings_folder)
+
+        transport = HoneypotTransport(client)
+        session.transport = transport
         transport.local_version = SSH_BANNER
-        transport.add_server_key(host_key)
-        server = SSHServer(addr[0])
-        transport.start_server(server=server)
+        for key in get_host_keys().values():
+            transport.add_server_key(key)
+        server = SSHServer(addr[0], session)
+        with SSH_HANDSHAKE_SECONDS.time():
+            transport.start_server(server=server)
 
-        channel = transport.accept(50)
+        channel = transport.accept(session_manager.auth_timeout or None)
         if channel is None:
             logging.warning("No channel opened")
             return
 
+        session.channel = channel
+        session.touch()
+        if session.recorder:
+            channel = RecordedChannel(channel, session.recorder)
+
         welcome_banner = "Welcome!\r\n"
         channel.send(welcome_banner)
 
-        handle_shell_session(channel, addr[0])
+        handle_shell_session(channel, addr[0], session)
     except Exception as e:
-        logging.error(f"ERROR handle_client(): {e}")
-        print(traceback.format_exc())
+        if session.close_reason is None:
+            logging.error(f"ERROR handle_client(): {e}")
+            print(traceback.format_exc())
     finally:
-        transport.close()
+        session_manager.release(session)
+        if session.recorder:
+            session.recorder.close()
 
-def start_server(host="0.0.0.0", port=2222):
+def start_server(host="0.0.0.0", port=2222, auth_timeout=AUTH_TIMEOUT, idle_timeout=IDLE_TIMEOUT, session_timeout=SESSION_TIMEOUT, reuse_port=False, sock=None, record_folder=None, aggregate_credentials=True, log_file=LOG_FILE):
+    global recordings_folder, credential_aggregator
+    setup_logging(log_file)
+    get_host_keys()
+    recordings_folder = record_folder
+    if aggregate_credentials and credential_aggregator is None:
+        credential_aggregator = CredentialAggregator(log_credential_summary)
+        credential_aggregator.start()
+    session_manager.auth_timeout = auth_timeout
+    session_manager.idle_timeout = idle_timeout
+    session_manager.session_timeout = session_timeout
+    session_manager.start_reaper()
+    metrics.register_collector(collect_session_metrics)
+    metrics.register_collector(collect_credential_metrics)
     try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        sock.bind((host, port))
-        sock.listen(100)
+        if sock is None:
+            sock = create_listener(host, port, reuse_port=reuse_port)
         log_event(event_type="socket_open", host=host, port=port)
 
         while True:
             conn, addr = sock.accept()
+            SSH_CONNECTIONS.inc()
             log_event(event_type="connection_open", host=addr[0], port=addr[1])
             client_thread = threading.Thread(target=handle_client, args=(conn, addr))
             client_thread.start()
-            print(f"Active Connections: {threading.active_count() - 1}")
+            # Full stats (fd scan, per-session walk) are served by the metrics collector instead
+            print(f"Active Sessions: {len(session_manager.sessions)}")
     except Exception as e:
         logging.error(f"ERROR start_server(): {e}")
         print(traceback.format_exc())
     finally:
+        if credential_aggregator:
+            credential_aggregator.flush()
         log_event(event_type="socket_close")
-        sock.close()
+        if sock:
+            sock.close()
 
 if __name__ == "__main__":
     start_server()
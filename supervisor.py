@@ -0,0 +1,174 @@
+import os
+import time
+import signal
+import socket
+import logging
+import logging.handlers
+import multiprocessing
+from typing import Dict, List, Optional, Callable
+import metrics
+
+RESTART_DELAY = 1  # seconds, doubled for every crash shortly after start
+MAX_RESTART_DELAY = 30
+MIN_HEALTHY_UPTIME = 10  # a worker that lived this long resets its backoff
+MONITOR_INTERVAL = 0.5
+
+LOG_QUEUE_DEPTH = metrics.gauge("honeypot_log_queue_depth", "Worker log records waiting to be written by the supervisor")
+
+def reuse_port_supported() -> bool:
+    return hasattr(socket, "SO_REUSEPORT")
+
+def create_listener(host: str, port: int, reuse_port: bool = False, backlog: int = 100) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        # Every worker binds its own socket and the kernel shards connections between them
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+class HoneypotTypeFilter(logging.Filter):
+    def __init__(self, honeypot_type: str):
+        super().__init__()
+        self.honeypot_type = honeypot_type
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.honeypot_type = self.honeypot_type
+        return True
+
+class RoutingHandler(logging.Handler):
+    """Writes each record from the shared worker queue to the handler for its honeypot type."""
+
+    def __init__(self, handlers: Dict[str, logging.Handler]):
+        super().__init__()
+        self.handlers = handlers
+
+    def handle(self, record: logging.LogRecord):
+        handler = self.handlers.get(getattr(record, "honeypot_type", None))
+        if handler:
+            handler.handle(record)
+
+    def emit(self, record: logging.LogRecord):
+        self.handle(record)
+
+    def close(self):
+        for handler in self.handlers.values():
+            handler.close()
+        super().close()
+
+def run_worker(target: Callable, args: tuple, kwargs: dict, honeypot_type: str, log_queue):
+    # Ctrl-C is handled by the supervisor, which then terminates the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    # Send log records to the supervisor instead of writing (and rotating) the
+    # log files from several processes at once.
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(HoneypotTypeFilter(honeypot_type))
+    root.addHandler(queue_handler)
+    root.setLevel(logging.INFO)
+
+    target(*args, **kwargs)
+
+class Worker:
+    def __init__(self, name: str, honeypot_type: str, target: Callable, args: tuple, kwargs: dict):
+        self.name = name
+        self.honeypot_type = honeypot_type
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs
+        self.process: Optional[multiprocessing.Process] = None
+        self.started_at = 0.0
+        self.restart_delay = RESTART_DELAY
+        self.restart_at = 0.0
+        self.restarts = 0
+
+class Supervisor:
+    """
+    Runs every honeypot listener as a separate process, restarts workers that
+    exit, and merges their log records into one stream per honeypot type.
+    """
+
+    def __init__(self, log_handlers: Dict[str, logging.Handler], extra_handlers: Optional[List[logging.Handler]] = None):
+        self.context = multiprocessing.get_context("fork")
+        self.log_queue = self.context.Queue()
+        self.pid = os.getpid()
+        metrics.register_collector(self.collect_metrics)
+        # extra_handlers see every record regardless of honeypot type (e.g. an EventShipper)
+        self.listener = logging.handlers.QueueListener(self.log_queue, RoutingHandler(log_handlers), *(extra_handlers or []))
+        self.workers: List[Worker] = []
+        self.stopping = False
+
+    def collect_metrics(self):
+        if os.getpid() != self.pid:
+            return  # a forked worker, the queue is the supervisor's to report
+        try:
+            LOG_QUEUE_DEPTH.set(self.log_queue.qsize())
+        except NotImplementedError:
+            pass  # macOS has no sem_getvalue()
+
+    def add_worker(self, name: str, honeypot_type: str, target: Callable, *args, **kwargs):
+        self.workers.append(Worker(name, honeypot_type, target, args, kwargs))
+
+    def start_worker(self, worker: Worker):
+        worker.process = self.context.Process(
+            target=run_worker,
+            args=(worker.target, worker.args, worker.kwargs, worker.honeypot_type, self.log_queue),
+            name=worker.name,
+            daemon=True,
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        print(f"Started {worker.name} (pid {worker.process.pid})")
+
+    def check_worker(self, worker: Worker):
+        if worker.process.is_alive():
+            if time.monotonic() - worker.started_at > MIN_HEALTHY_UPTIME:
+                worker.restart_delay = RESTART_DELAY
+            return
+
+        now = time.monotonic()
+        if not worker.restart_at:
+            print(f"{worker.name} (pid {worker.process.pid}) exited with code {worker.process.exitcode}, restarting in {worker.restart_delay}s")
+            worker.restart_at = now + worker.restart_delay
+            worker.restart_delay = min(worker.restart_delay * 2, MAX_RESTART_DELAY)
+        elif now >= worker.restart_at:
+            worker.restart_at = 0.0
+            worker.restarts += 1
+            self.start_worker(worker)
+
+    def stop(self, *_):
+        self.stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        self.listener.start()
+        try:
+            for worker in self.workers:
+                self.start_worker(worker)
+
+            while True:
+                time.sleep(MONITOR_INTERVAL)
+                if self.stopping:
+                    break
+                for worker in self.workers:
+                    self.check_worker(worker)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        for worker in self.workers:
+            if worker.process and worker.process.is_alive():
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.process:
+                worker.process.join(5)
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
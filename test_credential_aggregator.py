@@ -0,0 +1,62 @@
+from credential_aggregator import CredentialIndex, MAX_PROBE
+
+SLOTS = 16
+
+def colliding_keys(home: int, count: int):
+    """Keys that all hash to slot `home` of a SLOTS-sized index."""
+    return [home + SLOTS * i for i in range(1, count + 1)]
+
+def test_collisions_probe_to_following_slots():
+    index = CredentialIndex(SLOTS)
+    keys = colliding_keys(3, 3)
+    assert [index.increment(key) for key in keys] == [1, 1, 1]
+    assert [index.keys[slot] for slot in (3, 4, 5)] == keys
+
+    assert index.increment(keys[1]) == 2
+    assert [index.get(key) for key in keys] == [1, 2, 1]
+    assert index.get(colliding_keys(3, 4)[-1]) == 0
+    assert index.size == 3 and index.evictions == 0
+
+def test_probe_wraps_around_at_the_mask():
+    index = CredentialIndex(SLOTS)
+    keys = colliding_keys(SLOTS - 1, 3)
+    for key in keys:
+        index.increment(key)
+    assert [index.keys[slot] for slot in (SLOTS - 1, 0, 1)] == keys
+
+    index.increment(keys[2])
+    assert index.get(keys[2]) == 2
+    assert index.find(keys[2]) == (1, True)
+
+def test_full_probe_window_evicts_least_recently_seen():
+    index = CredentialIndex(SLOTS)
+    keys = colliding_keys(3, MAX_PROBE)
+    for key in keys:
+        index.increment(key)
+        index.increment(key)
+    for slot in range(3, 3 + MAX_PROBE):
+        index.last_seen[slot] = 100
+    index.last_seen[6] = 50  # keys[3] is the stalest
+
+    newcomer = colliding_keys(3, MAX_PROBE + 1)[-1]
+    assert index.increment(newcomer) == 1
+    assert index.keys[6] == newcomer
+    assert index.evictions == 1 and index.size == MAX_PROBE
+    assert index.get(keys[3]) == 0
+
+    # The evicted tuple is reported as first seen when it comes back
+    assert index.increment(keys[3]) == 1
+    assert index.evictions == 2
+    assert all(index.get(key) == 2 for key in keys[:3] + keys[4:])
+
+def test_zero_key_shares_the_slot_of_one():
+    index = CredentialIndex(SLOTS)
+    assert index.increment(0) == 1
+    assert index.keys[1] == 1
+    assert index.increment(1) == 2
+    assert index.get(0) == 2
+    assert index.size == 1
+
+def test_slots_round_up_to_a_power_of_two():
+    assert CredentialIndex(SLOTS).mask == SLOTS - 1
+    assert CredentialIndex(SLOTS + 1).mask == 2 * SLOTS - 1
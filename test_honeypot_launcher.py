@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+import socket
+import subprocess
+import paramiko
+from collector import start_collector
+from benchmark_utils import wait_for_port
+
+LAUNCHER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "honeypot_launcher.py")
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def read_text(file_path: str) -> str:
+    try:
+        with open(file_path) as f:
+            return f.read()
+    except FileNotFoundError:
+        return ""
+
+def failed_login(port: int):
+    transport = paramiko.Transport(socket.create_connection(("127.0.0.1", port), timeout=10))
+    try:
+        transport.start_client(timeout=10)
+        try:
+            transport.auth_password("root", "not-the-password")
+        except paramiko.AuthenticationException:
+            pass
+    finally:
+        transport.close()
+
+def test_collector_and_local_log_both_receive_events(tmp_path):
+    paramiko.RSAKey.generate(2048).write_private_key_file(str(tmp_path / "server.key"))
+    ssh_port, collector_port = free_port(), free_port()
+    server = start_collector("127.0.0.1", collector_port, str(tmp_path / "collected"))
+    env = dict(os.environ, FLASK_SECRET_KEY="test")
+    launcher = subprocess.Popen(
+        [sys.executable, LAUNCHER, "-t", "ssh", "-a", "127.0.0.1", "-s", str(ssh_port), "-c", f"127.0.0.1:{collector_port}", "--sensor-id", "test-sensor"],
+        cwd=tmp_path, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port("127.0.0.1", ssh_port)
+        failed_login(ssh_port)
+
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline:
+            local = read_text(str(tmp_path / "hp-ssh.log"))
+            collected = read_text(str(tmp_path / "collected" / "hp-ssh.log"))
+            if '"event_type": "login_fail"' in local and '"event_type": "login_fail"' in collected:
+                break
+            time.sleep(0.2)
+
+        assert '"event_type": "login_fail"' in local
+        assert '"event_type": "login_fail"' in collected
+        assert '"sensor_id": "test-sensor"' in collected
+    finally:
+        launcher.terminate()
+        launcher.wait(10)
+        server.shutdown()
+        server.server_close()
+        server.store.close()
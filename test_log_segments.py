@@ -0,0 +1,88 @@
+import io
+import os
+import json
+import datetime
+import pytest
+from log_segments import SegmentedLogHandler, iter_log_lines, list_segments, skip_to, format_timestamp, INDEX_SUFFIX
+
+BASE = datetime.datetime(2024, 1, 1).timestamp()
+
+def write_events(handler: SegmentedLogHandler, first: int, count: int):
+    entries = []
+    for i in range(first, first + count):
+        timestamp = format_timestamp(BASE + i)
+        line = json.dumps({"timestamp": timestamp, "event_type": "login_attempt", "n": i}) + "\n"
+        entries.append((line.encode("utf-8"), timestamp, "login_attempt"))
+    handler.write_many(entries)
+
+def read_numbers(file_path: str, start=None, end=None):
+    return [json.loads(line)["n"] for line in iter_log_lines(file_path, start, end)]
+
+def test_rotate_index_windowed_read(tmp_path):
+    file_path = str(tmp_path / "hp-ssh.log")
+    handler = SegmentedLogHandler(file_path, max_bytes=150_000, interval=0)
+    write_events(handler, 0, 5000)
+    handler.close()  # waits for background compression
+
+    indexes = [segment for segment in list_segments(file_path) if segment.get("indexed")]
+    assert len(indexes) > 1
+    assert all(index["path"].endswith(".gz") for index in indexes)
+    assert sum(index["events"] for index in indexes) + len(open(file_path).readlines()) == 5000
+
+    assert read_numbers(file_path) == list(range(5000))
+    start, end = format_timestamp(BASE + 1500), format_timestamp(BASE + 1600)
+    window = [n for n in read_numbers(file_path, start, end) if 1500 <= n <= 1600]
+    assert window == list(range(1500, 1601))
+    # Reading starts at the last checkpoint before the window
+    assert min(read_numbers(file_path, start)) == 1000
+
+def test_orphaned_segment_is_read_and_recovered(tmp_path):
+    file_path = str(tmp_path / "hp-ssh.log")
+    handler = SegmentedLogHandler(file_path, max_bytes=0, interval=0, compression=None)
+    write_events(handler, 0, 10)
+    handler.close()
+
+    # A segment rotated by a process that died before compressing/indexing it
+    orphan = file_path + ".20240101-000000"
+    os.rename(file_path, orphan)
+    assert read_numbers(file_path) == list(range(10))
+
+    handler = SegmentedLogHandler(file_path, max_bytes=0, interval=0)
+    handler.close()
+    assert os.path.exists(orphan + INDEX_SUFFIX)
+    assert os.path.exists(orphan + ".gz") and not os.path.exists(orphan)
+    assert read_numbers(file_path) == list(range(10))
+
+def test_second_writer_is_refused(tmp_path):
+    file_path = str(tmp_path / "hp-ssh.log")
+    owner = SegmentedLogHandler(file_path, max_bytes=2000, interval=0)
+    with pytest.raises(RuntimeError):
+        SegmentedLogHandler(file_path, max_bytes=2000, interval=0)
+
+    write_events(owner, 0, 100)
+    owner.close()
+    assert read_numbers(file_path) == list(range(100))
+
+    # Once the owner is gone the file can be taken over
+    handler = SegmentedLogHandler(file_path, max_bytes=2000, interval=0)
+    write_events(handler, 100, 100)
+    handler.close()
+    assert read_numbers(file_path) == list(range(200))
+
+class ForwardOnly(io.RawIOBase):
+    def __init__(self, data: bytes):
+        self.data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        chunk = self.data.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+def test_skip_to_non_seekable_stream():
+    f = io.BufferedReader(ForwardOnly(b"first\nsecond\nthird\n"))
+    assert not f.seekable()
+    skip_to(f, len(b"first\n"))
+    assert f.readline() == b"second\n"
@@ -0,0 +1,47 @@
+import time
+import argparse
+from app import app, db, LOG_FILE
+from log_segments import setup_logging
+from benchmark_utils import benchmark_log_file, silenced_stdout
+
+ROUTES = ["/login", "/register", "/import_passwords"]
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+    "python-requests/2.31.0",
+    "Mozilla/5.0 zgrab/0.x",
+]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure web honeypot requests/sec on anonymous GET floods")
+
+    parser.add_argument("-n", "--requests", type=int, default=2000)
+    parser.add_argument("--log-file", type=str, default=benchmark_log_file(LOG_FILE))
+
+    return parser.parse_args()
+
+def flood(client, route: str, requests: int) -> float:
+    start = time.perf_counter()
+    for i in range(requests):
+        client.get(route, headers={"User-Agent": USER_AGENTS[i % len(USER_AGENTS)]})
+    return requests / (time.perf_counter() - start)
+
+if __name__ == "__main__":
+    args = parse_args()
+    # Log like a running honeypot would, but not into its hp-web.log
+    setup_logging(args.log_file)
+
+    with app.app_context():
+        db.create_all()
+
+    results = {}
+    with silenced_stdout():
+        for render_cache in (False, True):
+            app.config["RENDER_CACHE"] = render_cache
+            client = app.test_client()
+            for route in ROUTES:
+                client.get(route)  # warm up
+                results[(route, render_cache)] = flood(client, route, args.requests)
+
+    for route in ROUTES:
+        uncached, cached = results[(route, False)], results[(route, True)]
+        print(f"{route:20} {uncached:8.1f} req/s uncached  {cached:8.1f} req/s cached  ({cached / uncached:.2f}x)")